@@ -12,18 +12,21 @@ import cv2
 import numpy as np
 from transformers import pipeline
 from aist_systems.utils import pil_image_from_bytes
+from aist_systems.utils.sources import FrameSource, open_source
+from aist_systems.utils.storage import DepthMapSink, DepthMapStorage
+from aist_systems.utils.temporal import DepthPropagator
 from PIL import Image
 import matplotlib.pyplot as plt
 from IPython.display import clear_output
 
 
-def test_camera(camera_index: int = 0) -> None:
+def test_camera(camera_index: int | str | FrameSource = 0) -> None:
     """
     Before using neural networks you can test your cameras.
-    :param camera_index:
+    :param camera_index: camera's index, path to a video or a directory with images, stream's url or FrameSource.
     :return:
     """
-    cam = cv2.VideoCapture(camera_index)
+    cam = open_source(camera_index)
     while True:
         ret, frame = cam.read()
         if not ret:
@@ -76,44 +79,73 @@ class DepthEstimator:
         """Get depth map from np.ndarray."""
         return self._output_perform(self.model(Image.fromarray(array)))
 
-    def from_camera(self, cam_ind: int = 0):
+    def from_camera(self, cam_ind: int | str | FrameSource = 0):
         """Get depth map from a camera device (single object)"""
-        camera = cv2.VideoCapture(cam_ind)
+        camera = open_source(cam_ind)
         while camera.grab():
             flag, frame = camera.retrieve()
             if flag:
+                camera.release()
                 return self.from_ndarray(frame)
-        raise "Failed to capture an image!"
+        raise RuntimeError("Failed to capture an image!")
 
     def from_camera_stream(
             self,
-            cam_ind: int = 0,
+            cam_ind: int | str | FrameSource = 0,
             single_object: bool = False,
             show: bool = True,
             save_data: bool = False,
-            max_iter: int = None
-            ) -> None | list[depth_output_type]:
+            max_iter: int = None,
+            sink_path: str = None,
+            storage_dtype: str = 'float32',
+            depth_range: tuple[float, float] = None,
+            keyframe_every: int = 1,
+            scene_change_threshold: float = None,
+            propagation: str = 'flow'
+            ) -> None | list[depth_output_type] | DepthMapStorage:
         """Get depth map from camera device.
 
         :param cam_ind: If you have several cameras, you can choose which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
         :param single_object: If you need just one shot from your camera - True, else - False.
         :param show: 'True' if you want to look at results.
         :param save_data: 'True' if you need to save data to a list.
         :param max_iter: Max num of iterations.
-        :return: if you chose to save data with results, you will get a list of results.
+        :param sink_path: If specified, saved data is streamed to memory-mapped files in this directory
+        instead of a list in RAM.
+        :param storage_dtype: 'float32', 'float16' or 'uint16' (quantized) - how depth maps are stored in 'sink_path'.
+        :param depth_range: (min, max) of depth values for 'uint16' storage. None - range of every depth map.
+        :param keyframe_every: The full model runs only every N-th frame (keyframe),
+        depth of other frames is propagated from the last keyframe (look at 'evaluate_keyframes' to choose N).
+        :param scene_change_threshold: A frame becomes a keyframe if it differs from the last keyframe
+        more than this value (0 - same, 1 - totally different). None - only 'keyframe_every' is used.
+        :param propagation: 'flow' - warp depth of the keyframe with optical flow, 'hold' - use it as is.
+        :return: if you chose to save data with results, you will get a list of results
+        (or DepthMapStorage - lazy handle of saved depth maps, if you specified 'sink_path').
         """
-        camera = cv2.VideoCapture(cam_ind)
+        camera = open_source(cam_ind)
         data_list = []
+        sink = None
+        if save_data and sink_path is not None:
+            sink = DepthMapSink(sink_path, dtype=storage_dtype, depth_range=depth_range)
+        propagator = None
+        if keyframe_every > 1 or scene_change_threshold is not None:
+            propagator = DepthPropagator(keyframe_every=keyframe_every,
+                                         scene_change_threshold=scene_change_threshold,
+                                         method=propagation)
         current_iter = 0
 
-        while camera.grab():
-            flag, frame = camera.retrieve()
-
-            if flag:
-                depth_map = self.from_ndarray(frame)
-                if show:
-                    self._show_results(output=depth_map)
-                if save_data:
+        for frame in camera:
+            if propagator is not None:
+                depth_map, _ = propagator.update(frame.image, estimate=self.from_ndarray)
+            else:
+                depth_map = self.from_ndarray(frame.image)
+            if show:
+                self._show_results(output=depth_map)
+            if save_data:
+                if sink is not None:
+                    sink.write(depth_map, timestamp=frame.timestamp)
+                else:
                     data_list.append(depth_map)
 
             if single_object:
@@ -130,5 +162,56 @@ class DepthEstimator:
                 if current_iter == max_iter:
                     break
 
+        camera.release()
+        if sink is not None:
+            return sink.close()
         if save_data:
             return data_list
+
+    def evaluate_keyframes(
+            self,
+            cam_ind: int | str | FrameSource = 0,
+            keyframe_intervals: tuple = (2, 3, 5, 10),
+            max_iter: int = 100,
+            propagation: str = 'flow',
+            scene_change_threshold: float = None
+            ) -> dict:
+        """Error of keyframe mode against per-frame inference (to choose 'keyframe_every').
+
+        :param cam_ind: Source of frames (better a recorded video).
+        :param keyframe_intervals: Values of 'keyframe_every' to evaluate.
+        :param max_iter: Num of frames.
+        :param propagation: 'flow' or 'hold'.
+        :param scene_change_threshold: Look at 'from_camera_stream'.
+        :return: {keyframe_every: {'mae': ..., 'relative_error': ..., 'keyframes_share': ...}}
+        mae - mean absolute error of depth, relative_error - mae divided by mean depth,
+        keyframes_share - part of frames where the full model runs.
+        """
+        camera = open_source(cam_ind)
+        frames, references = [], []
+        for frame in camera:
+            frames.append(frame.image)
+            references.append(self.from_ndarray(frame.image))
+            if len(frames) == max_iter:
+                break
+        camera.release()
+        mean_depth = float(np.mean([np.abs(reference).mean() for reference in references]))
+
+        results = {}
+        for keyframe_every in keyframe_intervals:
+            propagator = DepthPropagator(keyframe_every=keyframe_every,
+                                         scene_change_threshold=scene_change_threshold,
+                                         method=propagation)
+            errors = []
+            for image, reference in zip(frames, references):
+                # Keyframe's depth is the same as per-frame inference, so it isn't computed twice
+                depth_map, _ = propagator.update(image, estimate=lambda _, depth=reference: depth)
+                errors.append(float(np.abs(depth_map - reference).mean()))
+            mae = float(np.mean(errors))
+            results[keyframe_every] = {'mae': mae,
+                                       'relative_error': mae / mean_depth if mean_depth else 0.0,
+                                       'keyframes_share': propagator.keyframes / len(frames)}
+            print(f"keyframe_every={keyframe_every}: MAE {mae:.4f}, "
+                  f"relative error {100 * results[keyframe_every]['relative_error']:.2f}%, "
+                  f"full model on {100 * results[keyframe_every]['keyframes_share']:.0f}% of frames")
+        return results
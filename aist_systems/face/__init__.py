@@ -4,20 +4,32 @@ import requests
 import torch
 from facenet_pytorch import InceptionResnetV1, MTCNN
 from types import MethodType
-from time import sleep
+from time import sleep, perf_counter
 from aist_systems.utils import load, save, decode, get_hash
+from aist_systems.face.sharding import ShardedGallery
+from aist_systems.face.quality import QualityGate
+from aist_systems.face.cascade import PersonCascade
+from aist_systems.utils.sources import Frame, FrameSource, open_source
+from aist_systems.utils.recording import PreEventBuffer
+from aist_systems.utils.results import BackgroundResults, FaceResult
 from datetime import datetime
 import json
 
 
 def _detect_box(self, img, save_path=None):
     # Detect faces
-    batch_boxes, batch_probs, batch_points = self.detect(img, landmarks=True)
+    if self.person_cascade is not None:
+        batch_boxes, batch_probs, batch_points = self.person_cascade.detect(self, img)
+    else:
+        batch_boxes, batch_probs, batch_points = self.detect(img, landmarks=True)
     # Select faces
     if not self.keep_all:
         batch_boxes, batch_probs, batch_points = self.select_boxes(
             batch_boxes, batch_probs, batch_points, img, method=self.selection_method
         )
+    # Skip useless faces
+    if self.quality_gate is not None:
+        batch_boxes, batch_probs, batch_points = self.quality_gate.filter(img, batch_boxes, batch_probs, batch_points)
     # Extract faces
     faces = self.extract(img, batch_boxes, save_path)
     return batch_boxes, faces
@@ -48,12 +60,15 @@ class Recognizer:
         """
         self.log = {}
         self.has_faces = False
+        self.gallery = None
 
         self.resnet = InceptionResnetV1(pretrained='vggface2').eval()
         self.mtcnn = MTCNN(
             image_size=224, keep_all=True, thresholds=[0.4, 0.5, 0.5], min_face_size=60
         )
         self.mtcnn.detect_box = MethodType(_detect_box, self.mtcnn)
+        self.mtcnn.quality_gate = None
+        self.mtcnn.person_cascade = None
 
         if path_to_dict is not None:
             self.all_people_faces = load(path_to_dict)
@@ -61,10 +76,101 @@ class Recognizer:
             self.load_core_from_url(url="https://storage.yandexcloud.net/facecore/core.pkl",
                                     name_for_file="core")
 
+    def set_quality_gate(self,
+                         quality_gate: QualityGate = None,
+                         **kwargs):
+        """
+        Blurry, tiny, side-on or low-confidence faces can be skipped before recognition.
+        It saves time of the recognition model and reduces false 'Wrong person' results.
+        :param quality_gate: Your QualityGate. If not specified, it's made with kwargs.
+        :param kwargs: Params of QualityGate (min_prob, min_size, max_yaw, max_roll, min_sharpness).
+        Reject counters are available via 'self.mtcnn.quality_gate.report()'.
+        :return:
+        """
+        if quality_gate is None:
+            quality_gate = QualityGate(**kwargs)
+        self.mtcnn.quality_gate = quality_gate
+
+    def set_person_cascade(self,
+                           person_cascade: PersonCascade = None,
+                           **kwargs):
+        """
+        On wide-angle cameras face detection over the whole frame is slow.
+        With a cascade, a cheap person detector (YOLO) runs first and face detection runs only inside person boxes
+        (or doesn't run at all if nobody is in view).
+        :param person_cascade: Your PersonCascade. If not specified, it's made with kwargs.
+        :param kwargs: Params of PersonCascade (watcher, conf, expand, yolo_version...).
+        To turn the cascade off: 'self.mtcnn.person_cascade = None'.
+        :return:
+        """
+        if person_cascade is None:
+            person_cascade = PersonCascade(**kwargs)
+        self.mtcnn.person_cascade = person_cascade
+
     def _encode(self, img):
         res = self.resnet(torch.Tensor(img))
         return res
 
+    def _match(self, img_embedding, threshold: float) -> tuple[str, float]:
+        """The most similar person and the distance to him. 'Wrong person' if distance >= threshold."""
+        if self.gallery is not None:
+            min_key, distance = self.gallery.query(img_embedding, k=1)[0]
+        else:
+            detect_dict = {}
+            for k, v in self.all_people_faces.items():
+                detect_dict[k] = (v - img_embedding).norm().item()
+            min_key = min(detect_dict, key=detect_dict.get)
+            distance = detect_dict[min_key]
+
+        if distance >= threshold:
+            min_key = 'Wrong person'
+        return min_key, distance
+
+    def _num_of_faces(self) -> int:
+        if self.gallery is not None:
+            return len(self.gallery)
+        return len(self.all_people_faces.keys())
+
+    def _enroll(self, name: str, img_embedding):
+        if self.gallery is not None:
+            self.gallery.add(name, img_embedding)
+        else:
+            self.all_people_faces[name] = img_embedding
+
+    def _set_core(self, core: dict):
+        """Replace all faces with faces of the core."""
+        if self.gallery is not None:
+            self.gallery.clear()
+            for name, embedding in core.items():
+                self.gallery.add(name, embedding)
+        else:
+            self.all_people_faces = core
+
+    def use_sharded_gallery(self,
+                            num_shards: int = 2,
+                            addresses: list = None,
+                            **kwargs):
+        """
+        For very big watchlists faces can be held by several worker processes (or nodes).
+        Query embedding is sent to every shard, their top results are merged.
+        :param num_shards: Num of local worker processes.
+        :param addresses: Addresses (host, port) of shards started via 'aist_systems.face.sharding.serve_shard'
+        (for example on other nodes). If specified, local workers aren't started.
+        If a sharded gallery is already used, its faces are moved to the new one and the old one is closed.
+        :param kwargs: Other params of ShardedGallery (authkey - secret key of remote shards, rebalance_ratio).
+        :return:
+        """
+        gallery = ShardedGallery(num_shards=num_shards, addresses=addresses, **kwargs)
+        # If a sharded gallery is already used, faces are moved from it
+        faces = self.all_people_faces if self.gallery is None else self.gallery.to_dict()
+        for name, embedding in faces.items():
+            gallery.add(name, embedding)
+        if self.gallery is not None:
+            self.gallery.close()
+        self.gallery = gallery
+        # Faces are held by shards now
+        self.all_people_faces = {}
+
     def save_log(self,
                  path_for_saving: str,
                  clear_after_saving: bool = False):
@@ -81,8 +187,8 @@ class Recognizer:
             self.log.clear()
 
     def _take_photo(self,
-                    cam: int = 0):
-        cam = cv2.VideoCapture(cam)
+                    cam: int | str | FrameSource = 0):
+        cam = open_source(cam)
         is_taken = False
         received_image = None
 
@@ -132,7 +238,7 @@ class Recognizer:
         """
         loaded_object = load(path_to_core)
         if type(loaded_object) is dict:
-            self.all_people_faces = loaded_object
+            self._set_core(loaded_object)
         else:
             print(f"The object can't be converted to a core (Need dict, got {type(loaded_object)})")
 
@@ -148,7 +254,7 @@ class Recognizer:
         """
         with open(f"{name_for_file}.pkl", 'wb') as f:
             f.write(requests.get(url).content)
-        self.all_people_faces = load(f"{name_for_file}.pkl")
+        self._set_core(load(f"{name_for_file}.pkl"))
 
     def save_core(self, path):
         """
@@ -157,11 +263,14 @@ class Recognizer:
         :param path: path where file will be saved.
         :return:
         """
-        save(self.all_people_faces, path)
+        if self.gallery is not None:
+            save({name: torch.from_numpy(embedding) for name, embedding in self.gallery.to_dict().items()}, path)
+        else:
+            save(self.all_people_faces, path)
 
     def add_face(self,
                  name=None,
-                 camera_index: int = 0):
+                 camera_index: int | str | FrameSource = 0):
         """
         Adding face to recognize it. When yoy will launch this function,
         you will have a window with your camera filming you.
@@ -177,14 +286,14 @@ class Recognizer:
         :return:
         """
         if name is None:
-            name = f"User {len(self.all_people_faces.keys())}"
+            name = f"User {self._num_of_faces()}"
 
         received_image = self._take_photo(cam=camera_index)
         if type(received_image) is not type(None):
             batch_boxes, cropped_image = self.mtcnn.detect_box(received_image)
             if cropped_image is not None:
                 img_embedding = self._encode(cropped_image)
-                self.all_people_faces[name] = img_embedding
+                self._enroll(name, img_embedding)
                 self.has_faces = True
             else:
                 print("Failed to add face")
@@ -201,12 +310,12 @@ class Recognizer:
         :return:
         """
         if name is None:
-            name = f"User {len(self.all_people_faces.keys())}"
+            name = f"User {self._num_of_faces()}"
 
         current_image = cv2.imread(path_to_image)
         cropped_image = self.mtcnn(current_image)
         if cropped_image is not None:
-            self.all_people_faces[name] = self._encode(cropped_image).squeeze()
+            self._enroll(name, self._encode(cropped_image).squeeze())
 
     def predict_from_bytes(self,
                            image_bytes: bytes,
@@ -226,60 +335,120 @@ class Recognizer:
         if cropped_images is not None:
             for box, cropped in zip(batch_boxes, cropped_images):
                 img_embedding = self._encode(cropped.unsqueeze(0))
-                detect_dict = {}
-                for k, v in self.all_people_faces.items():
-                    detect_dict[k] = (v - img_embedding).norm().item()
-                min_key = min(detect_dict, key=detect_dict.get)
-                if detect_dict[min_key] >= threshold:
-                    min_key = 'Wrong person'
+                min_key, distance = self._match(img_embedding, threshold)
         return min_key
 
+    def _recognize(self,
+                   image,
+                   frame: Frame,
+                   camera,
+                   threshold: float,
+                   scale: float = 1.0) -> FaceResult:
+        """Recognize all faces of one frame. 'scale' - how the image was resized relative to the frame."""
+        start_time = perf_counter()
+        batch_boxes, cropped_images = self.mtcnn.detect_box(image)
+        detection_time = perf_counter()
+        result = FaceResult(camera=camera, timestamp=frame.timestamp, frame_index=frame.index)
+
+        if cropped_images is not None:
+            result.boxes = (batch_boxes / scale).tolist()
+            # All faces of the frame are encoded in one batch
+            with torch.no_grad():
+                img_embeddings = self._encode(cropped_images)
+            for img_embedding in img_embeddings:
+                min_key, distance = self._match(img_embedding.unsqueeze(0), threshold)
+                result.identities.append(min_key)
+                result.distances.append(distance)
+
+        end_time = perf_counter()
+        result.latency = {'detection': detection_time - start_time,
+                          'recognition': end_time - detection_time,
+                          'total': end_time - start_time}
+        return result
+
+    def _results(self,
+                 cam: int | str | FrameSource = 0,
+                 threshold: float = 0.7,
+                 recorder: PreEventBuffer = None):
+        """Generator of FaceResults of every frame of a camera. The camera is released when it's closed."""
+        vdo = open_source(cam)
+        try:
+            for frame in vdo:
+                if recorder is not None:
+                    recorder.push(frame.image, timestamp=frame.timestamp)
+                result = self._recognize(frame.image, frame, camera=vdo.name, threshold=threshold)
+                if result.wrong_person and recorder is not None:
+                    recorder.trigger("Wrong person", timestamp=frame.timestamp)
+                yield result
+        finally:
+            vdo.release()
+
+    def results(self,
+                cam: int | str | FrameSource = 0,
+                threshold: float = 0.7,
+                recorder: PreEventBuffer = None,
+                buffer_size: int = 64,
+                overflow: str = 'drop_oldest') -> BackgroundResults:
+        """
+        Recognizer works in a separate thread and gives a FaceResult of every frame
+        (camera, timestamp, boxes, identities, distances, latencies). Nothing is printed or written to 'self.log'.
+            with face_recognizer.results() as results:
+                for result in results:
+                    ...
+        Or in async code:
+            async with face_recognizer.results() as results:
+                async for result in results:
+                    ...
+        :param cam: if you have several cameras, you can specify which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
+        :param threshold: confidence threshold: less = more strict
+        :param recorder: PreEventBuffer - if you want to save clips around 'Wrong person' events.
+        :param buffer_size: Max num of results waiting for you.
+        :param overflow: What to do if you are slower than the camera:
+        'drop_oldest', 'drop_newest' or 'block' (camera waits for you).
+        :return: Iterator (and async iterator) of results. Stop it with 'close()'.
+        """
+        assert self.has_faces, "You didn't add any faces"
+        return BackgroundResults(self._results(cam, threshold=threshold, recorder=recorder),
+                                 buffer_size=buffer_size,
+                                 overflow=overflow)
+
     def launch(self,
-               cam: int = 0,
+               cam: int | str | FrameSource = 0,
                threshold: float = 0.7,
                stop_when_rec: bool = False,
                write_logs: bool = False,
                write_logs_every: int = 500,
-               print_logs: bool = True):
+               print_logs: bool = True,
+               recorder: PreEventBuffer = None):
         """
         Launch recognizer.
+        If you need results in your code, use 'Recognizer.results'.
         :param cam: if you have several cameras, you can specify which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
         :param threshold: confidence threshold: less = more strict
         :param stop_when_rec: if Recognizer detected right person, it can stop using camera.
         :param write_logs: If you want to save detection model's predictions with its time, choose True
         :param write_logs_every: How many times model have to save her predictions to the RAM,
         before the log will be saved as a file.
         :param print_logs: True - if you want to see logs in your console.
+        :param recorder: PreEventBuffer - if you want to save clips around 'Wrong person' events.
         :return:
         """
         assert self.has_faces, "You didn't add any faces"
-        vdo = cv2.VideoCapture(cam)
         saving_dir = str(datetime.now())
         if write_logs:
             os.mkdir(saving_dir)
 
-        while vdo.grab():
-            _, img0 = vdo.retrieve()
-            batch_boxes, cropped_images = self.mtcnn.detect_box(img0)
-
-            if cropped_images is not None:
-                for box, cropped in zip(batch_boxes, cropped_images):
-                    wrong_person = False
-                    img_embedding = self._encode(cropped.unsqueeze(0))
-                    detect_dict = {}
-                    for k, v in self.all_people_faces.items():
-                        detect_dict[k] = (v - img_embedding).norm().item()
-                    min_key = min(detect_dict, key=detect_dict.get)
-
-                    if detect_dict[min_key] >= threshold:
-                        min_key = 'Wrong person'
-                        wrong_person = True
+        results = self._results(cam, threshold=threshold, recorder=recorder)
+        try:
+            for result in results:
+                for min_key, distance in zip(result.identities, result.distances):
+                    wrong_person = distance >= threshold
 
                     if print_logs:
                         if not wrong_person:
                             print(f"Hi, {min_key}")
-                            if stop_when_rec:
-                                break
                         else:
                             print("Wrong person detected!")
 
@@ -288,7 +457,11 @@ class Recognizer:
                         if len(self.log.keys()) == write_logs_every:
                             self.save_log(path_for_saving=os.path.join(saving_dir, str(datetime.now()) + '.json'),
                                           clear_after_saving=True)
-        vdo.release()
+
+                    if stop_when_rec and not wrong_person:
+                        return
+        finally:
+            results.close()
 
 
 class Unlocker(Recognizer):
@@ -329,13 +502,14 @@ class Unlocker(Recognizer):
         self._hash_method = None
 
     def launch(self,
-               cam: int = 0,
+               cam: int | str | FrameSource = 0,
                threshold: float = 0.7,
                num_of_attempts: int = 10,
                **kwargs) -> bool:
         """
         Face recognition part of Unlocker. If you need whole unlock-system use Unlocker.unlock()
         :param cam: if you have several cameras, you can choose which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
         :param threshold: confidence threshold: less = more strict
         :param num_of_attempts: If camera detects face but can't recognize it, the counter of unknown faces increase.
         You can choose the highest value of this counter
@@ -343,27 +517,17 @@ class Unlocker(Recognizer):
         True - if recognized and the access is open.
         False - faces aren't recognized but detected many times.
         """
-        vdo = cv2.VideoCapture(cam)
-        wrong_person_detects = 0
         assert self.has_faces, "You didn't add any faces"
+        wrong_person_detects = 0
 
-        while vdo.grab():
-            _, img0 = vdo.retrieve()
-            batch_boxes, cropped_images = self.mtcnn.detect_box(img0)
-
-            if cropped_images is not None:
-                for box, cropped in zip(batch_boxes, cropped_images):
-                    wrong_person = False
-                    img_embedding = self._encode(cropped.unsqueeze(0))
-                    detect_dict = {}
-                    for k, v in self.all_people_faces.items():
-                        detect_dict[k] = (v - img_embedding).norm().item()
-                    min_key = min(detect_dict, key=detect_dict.get)
-
-                    if detect_dict[min_key] >= threshold:
-                        min_key = 'Wrong person'
+        results = self._results(cam, threshold=threshold)
+        try:
+            for result in results:
+                for min_key, distance in zip(result.identities, result.distances):
+                    wrong_person = distance >= threshold
+
+                    if wrong_person:
                         wrong_person_detects += 1
-                        wrong_person = True
                         if wrong_person_detects == num_of_attempts:
                             print("Too much attempts!")
                             return False
@@ -373,6 +537,9 @@ class Unlocker(Recognizer):
                         return True
                     else:
                         print("Wrong person detected!")
+        finally:
+            results.close()
+        return False
 
     def set_password(self,
                      hash_object: str,
@@ -406,7 +573,7 @@ class Unlocker(Recognizer):
         return False
 
     def unlock(self,
-               cam: int = 0,
+               cam: int | str | FrameSource = 0,
                threshold: float = 0.7,
                num_of_attempts: int = 10,
                password_attempts: int = 3) -> bool:
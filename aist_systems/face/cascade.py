@@ -0,0 +1,100 @@
+"""
+    Cascade for face detection: cheap person detector first, face detector only inside person boxes.
+"""
+import numpy as np
+from aist_systems.watching import Watcher2D
+from aist_systems.watching.tracking import box_iou
+
+
+class PersonCascade:
+    """
+    Runs YOLO (class 'person' only) on a frame and MTCNN only inside expanded person boxes.
+    If nobody is in view, MTCNN isn't run at all. Face boxes and landmarks are mapped back to frame coordinates.
+
+    To use it:
+        face_recognizer.set_person_cascade()
+        face_recognizer.launch()
+    """
+    person_class = 0
+
+    def __init__(self,
+                 watcher: Watcher2D = None,
+                 conf: float = 0.4,
+                 expand: float = 0.15,
+                 duplicate_iou: float = 0.5,
+                 **watcher_kwargs):
+        """
+        :param watcher: Watcher2D whose detection model will be used (if you already have one).
+        :param conf: Min confidence of person boxes.
+        :param expand: Person boxes are expanded by this part of their size on every side.
+        :param duplicate_iou: Faces found in several overlapping person boxes are merged if their IoU is more.
+        :param watcher_kwargs: Params of Watcher2D (yolo_version, backend, imgsz) if watcher isn't specified.
+        """
+        self.watcher = Watcher2D(**watcher_kwargs) if watcher is None else watcher
+        self.conf = conf
+        self.expand = expand
+        self.duplicate_iou = duplicate_iou
+
+        self.frames = 0
+        self.frames_without_persons = 0
+
+    def person_boxes(self, img: np.ndarray) -> list[tuple[int, int, int, int]]:
+        """Expanded person boxes in pixels."""
+        height, width = img.shape[:2]
+        output = self.watcher._predict(img, classes=[self.person_class], conf=self.conf, verbose=False)
+        boxes = []
+        for x1, y1, x2, y2 in output.boxes.xyxy.tolist():
+            margin_x, margin_y = (x2 - x1) * self.expand, (y2 - y1) * self.expand
+            boxes.append((max(int(x1 - margin_x), 0), max(int(y1 - margin_y), 0),
+                          min(int(x2 + margin_x), width), min(int(y2 + margin_y), height)))
+        return boxes
+
+    def _merge_duplicates(self, boxes: np.ndarray, probs: np.ndarray) -> list[int]:
+        keep = []
+        for ind in np.argsort(-probs):
+            if all(box_iou(boxes[ind], boxes[kept]) <= self.duplicate_iou for kept in keep):
+                keep.append(ind)
+        return keep
+
+    def detect(self, mtcnn, img):
+        """
+        Same output as MTCNN.detect(img, landmarks=True) for one image.
+        :param mtcnn: MTCNN model.
+        :param img: Frame.
+        :return: (boxes, probs, points) in frame coordinates or (None, [None], None) if there are no faces.
+        """
+        img = np.asarray(img)
+        self.frames += 1
+        person_boxes = self.person_boxes(img)
+        if not person_boxes:
+            self.frames_without_persons += 1
+            return None, [None], None
+
+        all_boxes, all_probs, all_points = [], [], []
+        min_size = getattr(mtcnn, 'min_face_size', 0)
+        for x1, y1, x2, y2 in person_boxes:
+            # MTCNN can't search a crop smaller than its min face size (and fails on it)
+            if min(x2 - x1, y2 - y1) < min_size:
+                continue
+            crop = np.ascontiguousarray(img[y1:y2, x1:x2])
+            boxes, probs, points = mtcnn.detect(crop, landmarks=True)
+            if boxes is None:
+                continue
+            # Map crops back to frame coordinates
+            boxes[:, [0, 2]] += x1
+            boxes[:, [1, 3]] += y1
+            points[..., 0] += x1
+            points[..., 1] += y1
+            all_boxes.append(boxes)
+            all_probs.append(probs)
+            all_points.append(points)
+
+        if not all_boxes:
+            return None, [None], None
+        boxes, probs, points = np.concatenate(all_boxes), np.concatenate(all_probs), np.concatenate(all_points)
+        keep = self._merge_duplicates(boxes, probs)
+        return boxes[keep], probs[keep], points[keep]
+
+    def report(self) -> dict:
+        """Num of processed frames and num of frames where face detection was skipped."""
+        return {'frames': self.frames, 'frames_without_persons': self.frames_without_persons}
@@ -3,6 +3,10 @@ import cv2
 from datetime import datetime
 import os
 import threading
+from aist_systems.utils.scheduling import LoadScheduler
+from aist_systems.utils.sources import open_source
+from aist_systems.utils.recording import PreEventBuffer
+from aist_systems.utils.results import BackgroundResults
 
 
 class Recognizer(face.Recognizer):
@@ -10,68 +14,128 @@ class Recognizer(face.Recognizer):
     Recognizer for working with several cameras
     """
     def single_thread(self,
-                      cameras: list[int],
+                      cameras: list,
                       threshold: float = 0.7,
                       write_logs: bool = False,
                       write_logs_every: int = 500,
-                      print_logs: bool = True):
+                      print_logs: bool = True,
+                      scheduler: LoadScheduler = None,
+                      recorders: dict[int | str, PreEventBuffer] = None):
         """
         If you have some cameras, you can use them all in this func.
         This function works on only 1 thread,
         So everything works sequentially.
 
-        :param cameras: Specify cameras' indexes.
+        :param cameras: Specify cameras' indexes
+        (or paths to videos or directories with images, streams' urls, FrameSources).
         :param threshold: confidence threshold.
         :param write_logs: 'True' if you want to write logs.
         :param write_logs_every: How many times logs will be stored in RAM before saving.
         :param print_logs: 'True' if you want to see logs on your console.
+        :param scheduler: LoadScheduler that keeps cameras inside their latency budgets
+        (skips frames and lowers resolution of less important cameras when the loop is overloaded).
+        :param recorders: {camera's name: PreEventBuffer} - if you want to save clips around 'Wrong person' events.
         :return:
         """
         assert self.has_faces, "You didn't add any faces"
-
-        devices = [cv2.VideoCapture(cam_ind) for cam_ind in cameras]
         saving_dir = str(datetime.now())
 
         if write_logs:
             os.mkdir(saving_dir)
 
-        while True:
-            for camera_index, current_device in zip(cameras, devices):
-                flag, image = current_device.read()
-
-                batch_boxes, cropped_images = self.mtcnn.detect_box(image)
-
-                if cropped_images is not None:
-                    for box, cropped in zip(batch_boxes, cropped_images):
-                        wrong_person = False
-                        img_embedding = self._encode(cropped.unsqueeze(0))
-                        detect_dict = {}
-                        for k, v in self.all_people_faces.items():
-                            detect_dict[k] = (v - img_embedding).norm().item()
-                        min_key = min(detect_dict, key=detect_dict.get)
-
-                        if detect_dict[min_key] >= threshold:
-                            min_key = 'Wrong person'
-                            wrong_person = True
-
-                        if print_logs:
-                            if not wrong_person:
-                                print(f"Hi, {min_key} (camera {camera_index})")
-                            else:
-                                print(f"Wrong person detected! (camera {camera_index})")
-
-                        if write_logs:
-                            self.log[str(datetime.now())] = min_key + f" (camera {camera_index})"
-                            if len(self.log.keys()) == write_logs_every:
-                                self.save_log(path_for_saving=os.path.join(saving_dir, str(datetime.now()) + '.json'),
-                                              clear_after_saving=True)
+        for result in self._cameras_results(cameras, threshold=threshold, scheduler=scheduler, recorders=recorders):
+            for min_key, distance in zip(result.identities, result.distances):
+                wrong_person = distance >= threshold
+
+                if print_logs:
+                    if not wrong_person:
+                        print(f"Hi, {min_key} (camera {result.camera})")
+                    else:
+                        print(f"Wrong person detected! (camera {result.camera})")
+
+                if write_logs:
+                    self.log[str(datetime.now())] = min_key + f" (camera {result.camera})"
+                    if len(self.log.keys()) == write_logs_every:
+                        self.save_log(path_for_saving=os.path.join(saving_dir, str(datetime.now()) + '.json'),
+                                      clear_after_saving=True)
+
+    def _cameras_results(self,
+                         cameras: list,
+                         threshold: float = 0.7,
+                         scheduler: LoadScheduler = None,
+                         recorders: dict[int | str, PreEventBuffer] = None):
+        """Generator of FaceResults of several cameras (round-robin). Cameras are released when it's closed."""
+        devices = [open_source(cam_ind) for cam_ind in cameras]
+        if recorders is None:
+            recorders = {}
+
+        try:
+            while not all(current_device.finished for current_device in devices):
+                for current_device in devices:
+                    frame = current_device.read_frame()
+                    if frame is None:
+                        if scheduler is not None:
+                            scheduler.remove_camera(current_device.name)
+                        continue
+                    image = frame.image
+                    recorder = recorders.get(current_device.name)
+                    if recorder is not None:
+                        recorder.push(image, timestamp=frame.timestamp)
+                    scale = 1.0
+                    if scheduler is not None:
+                        process, scale = scheduler.visit(current_device.name)
+                        if not process:
+                            continue
+                        if scale != 1.0:
+                            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+                    result = self._recognize(image, frame,
+                                             camera=current_device.name,
+                                             threshold=threshold,
+                                             scale=scale)
+                    if result.wrong_person and recorder is not None:
+                        recorder.trigger("Wrong person", timestamp=frame.timestamp)
+                    yield result
+        finally:
+            for current_device in devices:
+                current_device.release()
+
+    def results_from_cameras(self,
+                             cameras: list,
+                             threshold: float = 0.7,
+                             scheduler: LoadScheduler = None,
+                             recorders: dict[int | str, PreEventBuffer] = None,
+                             buffer_size: int = 64,
+                             overflow: str = 'drop_oldest') -> BackgroundResults:
+        """
+        Same as 'Recognizer.results', but for several cameras.
+        'camera' of every FaceResult is the camera's index, url, path or FrameSource's name.
+
+        :param cameras: Specify cameras' indexes
+        (or paths to videos or directories with images, streams' urls, FrameSources).
+        :param threshold: confidence threshold.
+        :param scheduler: LoadScheduler that keeps cameras inside their latency budgets.
+        :param recorders: {camera's name: PreEventBuffer} - if you want to save clips around 'Wrong person' events.
+        :param buffer_size: Max num of results waiting for you.
+        :param overflow: What to do if you are slower than cameras: 'drop_oldest', 'drop_newest' or 'block'.
+        :return: Iterator (and async iterator) of results. Stop it with 'close()'.
+        """
+        assert self.has_faces, "You didn't add any faces"
+        return BackgroundResults(self._cameras_results(cameras,
+                                                       threshold=threshold,
+                                                       scheduler=scheduler,
+                                                       recorders=recorders),
+                                 buffer_size=buffer_size,
+                                 overflow=overflow)
 
     def multy_thread(self,
-                     cameras: list[int],
+                     cameras: list,
                      threshold: float = 0.7,
                      write_logs: bool = False,
                      write_logs_every: int = 500,
-                     print_logs: bool = True):
+                     print_logs: bool = True,
+                     scheduler: LoadScheduler = None,
+                     recorders: dict[int | str, PreEventBuffer] = None):
         """Get predictions from several cameras via multy-threading.
 
         :param cameras: Specify cameras' indexes.
@@ -79,12 +143,16 @@ class Recognizer(face.Recognizer):
         :param write_logs: 'True' if you want to write logs.
         :param write_logs_every: How many times logs will be stored in RAM before saving.
         :param print_logs: 'True' if you want to see logs on your console.
+        :param scheduler: LoadScheduler shared by all threads.
+        :param recorders: {camera's name: PreEventBuffer} - if you want to save clips around 'Wrong person' events.
         :return:
         """
         func_kwargs = {'threshold': threshold,
                        'write_logs': write_logs,
                        'write_logs_every': write_logs_every,
-                       'print_logs': print_logs}
+                       'print_logs': print_logs,
+                       'scheduler': scheduler,
+                       'recorders': recorders}
         thread_list = []
 
         for current_camera in cameras:
@@ -0,0 +1,120 @@
+"""
+    Quality gate for faces: useless crops (blurry, tiny, side-on, low-confidence) are rejected before embedding.
+"""
+import math
+import cv2
+import numpy as np
+
+
+class QualityGate:
+    """
+    Checks detected faces before they go to the recognition model.
+
+    Checks (from the cheapest one):
+        'probability' - detection model's confidence;
+        'size' - the smallest side of the face box in pixels;
+        'pose' - yaw and roll of the face estimated by landmarks (eyes and nose);
+        'sharpness' - variance of Laplacian of the face crop.
+
+    To use it:
+        face_recognizer.set_quality_gate(min_prob=0.95, min_size=60)
+        face_recognizer.launch()
+        print(face_recognizer.mtcnn.quality_gate.report())
+    """
+    reject_reasons = ('probability', 'size', 'pose', 'sharpness')
+
+    def __init__(self,
+                 min_prob: float = 0.9,
+                 min_size: int = 40,
+                 max_yaw: float = 0.3,
+                 max_roll: float = 25.0,
+                 min_sharpness: float = 20.0,
+                 sharpness_size: int = 64):
+        """
+        :param min_prob: Min confidence of the detection model.
+        :param min_size: Min side of the face box (pixels).
+        :param max_yaw: Max horizontal shift of the nose from the middle of eyes (in distances between eyes).
+        0 - frontal face, 0.5 - nose is in front of an eye.
+        :param max_roll: Max tilt of the line between eyes (degrees).
+        :param min_sharpness: Min variance of Laplacian of the face crop. None - don't check sharpness.
+        :param sharpness_size: Face crop is resized to this size before sharpness check
+        (so the score doesn't depend on face size).
+        """
+        self.min_prob = min_prob
+        self.min_size = min_size
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.min_sharpness = min_sharpness
+        self.sharpness_size = sharpness_size
+
+        self.passed = 0
+        self.rejected = {reason: 0 for reason in self.reject_reasons}
+
+    def sharpness(self, img: np.ndarray, box) -> float:
+        """Variance of Laplacian of the face crop."""
+        height, width = img.shape[:2]
+        x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+        x2, y2 = min(int(box[2]), width), min(int(box[3]), height)
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        crop = img[y1:y2, x1:x2]
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        crop = cv2.resize(crop, (self.sharpness_size, self.sharpness_size), interpolation=cv2.INTER_AREA)
+        return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+    def _bad_pose(self, points) -> bool:
+        left_eye, right_eye, nose = points[0], points[1], points[2]
+        eyes_distance = right_eye[0] - left_eye[0]
+        if eyes_distance <= 0:
+            return True
+        yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eyes_distance
+        roll = abs(math.degrees(math.atan2(right_eye[1] - left_eye[1], eyes_distance)))
+        return yaw > self.max_yaw or roll > self.max_roll
+
+    def check(self, img: np.ndarray, box, prob: float, points) -> str | None:
+        """
+        Check one face.
+        :return: Reason of rejection or None if the face is good.
+        """
+        if prob is None or prob < self.min_prob:
+            return 'probability'
+        if min(box[2] - box[0], box[3] - box[1]) < self.min_size:
+            return 'size'
+        if points is not None and self._bad_pose(points):
+            return 'pose'
+        if self.min_sharpness is not None and self.sharpness(img, box) < self.min_sharpness:
+            return 'sharpness'
+        return None
+
+    def filter(self, img, batch_boxes, batch_probs, batch_points):
+        """
+        Keep only good faces of one image (output of MTCNN.detect).
+        :return: (boxes, probs, points) of good faces, or (None, [None], None) if there are no good faces.
+        """
+        if batch_boxes is None:
+            return batch_boxes, batch_probs, batch_points
+        img = np.asarray(img)
+        keep = []
+        for ind, box in enumerate(batch_boxes):
+            points = None if batch_points is None else batch_points[ind]
+            reason = self.check(img, box, batch_probs[ind], points)
+            if reason is None:
+                keep.append(ind)
+                self.passed += 1
+            else:
+                self.rejected[reason] += 1
+
+        if not keep:
+            return None, [None], None
+        return (batch_boxes[keep],
+                batch_probs[keep],
+                None if batch_points is None else batch_points[keep])
+
+    def report(self) -> dict:
+        """Num of passed faces and num of rejected faces by every reason."""
+        return {'passed': self.passed, **{f"rejected_{reason}": count for reason, count in self.rejected.items()}}
+
+    def reset_counters(self):
+        self.passed = 0
+        self.rejected = {reason: 0 for reason in self.reject_reasons}
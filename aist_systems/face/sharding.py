@@ -0,0 +1,266 @@
+"""
+    Sharded gallery of faces.
+    Identities are partitioned across worker processes (or nodes), a query is broadcast to all shards,
+    every shard returns its top-k and the results are merged.
+"""
+import heapq
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+
+def _to_vector(embedding) -> np.ndarray:
+    """Embedding (torch.Tensor or array) as a flat float32 vector."""
+    if hasattr(embedding, 'detach'):
+        embedding = embedding.detach().cpu().numpy()
+    return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+
+class GalleryShard:
+    """Part of a gallery held by one worker. Embeddings are stored in one matrix for fast scanning."""
+    # Methods a coordinator can call
+    commands = ('add', 'pop', 'query', 'identities', 'items')
+
+    def __init__(self, capacity: int = 1024):
+        self.names = []
+        self.positions = {}
+        self.embeddings = None
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str, vector: np.ndarray):
+        if name in self.positions:
+            self.embeddings[self.positions[name]] = vector
+            return
+        if self.embeddings is None:
+            self.embeddings = np.empty((self.capacity, vector.shape[0]), dtype=np.float32)
+        elif len(self.names) == self.embeddings.shape[0]:
+            self.embeddings = np.concatenate([self.embeddings, np.empty_like(self.embeddings)])
+        self.positions[name] = len(self.names)
+        self.embeddings[len(self.names)] = vector
+        self.names.append(name)
+
+    def pop(self, name: str) -> np.ndarray:
+        """Remove an identity and return its embedding."""
+        position = self.positions.pop(name)
+        vector = self.embeddings[position].copy()
+        last_position = len(self.names) - 1
+        if position != last_position:
+            last_name = self.names[last_position]
+            self.embeddings[position] = self.embeddings[last_position]
+            self.names[position] = last_name
+            self.positions[last_name] = position
+        self.names.pop()
+        return vector
+
+    def query(self, vector: np.ndarray, k: int = 1) -> list[tuple[float, str]]:
+        """Top-k nearest identities as (distance, name)."""
+        if not self.names:
+            return []
+        distances = np.linalg.norm(self.embeddings[:len(self.names)] - vector, axis=1)
+        k = min(k, len(self.names))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        return [(float(distances[ind]), self.names[ind]) for ind in nearest]
+
+    def identities(self) -> list:
+        return list(self.names)
+
+    def items(self) -> dict:
+        return {name: self.embeddings[position].copy() for name, position in self.positions.items()}
+
+
+def _serve(conn, shard: GalleryShard) -> bool:
+    """Answer commands of a coordinator. Returns True if the shard was asked to stop."""
+    while True:
+        try:
+            command, *args = conn.recv()
+        except (EOFError, OSError):
+            return False
+        if command == 'stop':
+            conn.close()
+            return True
+        if command not in GalleryShard.commands:
+            # Unknown command means a broken or hostile coordinator
+            conn.close()
+            return False
+        conn.send(getattr(shard, command)(*args))
+
+
+def _local_worker(conn):
+    _serve(conn, GalleryShard())
+
+
+def serve_shard(authkey: bytes,
+                address: tuple = ('localhost', 6000)):
+    """
+    Run a shard on this node. Then you can connect to it from a coordinator:
+        ShardedGallery(addresses=[('<host of this node>', 6000), ...], authkey=<the same key>)
+    Anyone who knows the key can send data to the shard, so use a secret random key
+    (for example 'secrets.token_bytes(32)') and don't expose the port to untrusted networks.
+    :param authkey: Secret key that coordinators have to use.
+    :param address: (host, port) the shard will listen to.
+    :return:
+    """
+    assert authkey, "Specify a secret authkey"
+    shard = GalleryShard()
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as error:
+                # A peer with a wrong key or a dropped handshake mustn't stop the shard
+                print(f"Rejected connection: {error!r}")
+                continue
+            with conn:
+                if _serve(conn, shard):
+                    break
+
+
+class ShardedGallery:
+    """
+    Gallery of faces that doesn't fit one process.
+
+    Local shards (worker processes):
+        gallery = ShardedGallery(num_shards=4)
+    Remote shards (started with 'serve_shard' on other nodes):
+        gallery = ShardedGallery(addresses=[('node1', 6000), ('node2', 6000)], authkey=<secret key of shards>)
+
+    Then:
+        gallery.add('User 0', embedding)
+        gallery.query(embedding, k=5)  # [('User 0', 0.12), ...]
+    """
+    def __init__(self,
+                 num_shards: int = 2,
+                 addresses: list = None,
+                 authkey: bytes = None,
+                 rebalance_ratio: float = 1.2):
+        """
+        :param num_shards: Num of local worker processes (if addresses aren't specified).
+        :param addresses: Addresses (host, port) of shards started via 'serve_shard'.
+        :param authkey: Secret key of remote shards (the one passed to 'serve_shard'). Required with addresses.
+        :param rebalance_ratio: When the largest shard is bigger than the smallest one more than this ratio,
+        identities are moved between shards.
+        """
+        self.rebalance_ratio = rebalance_ratio
+        self.authkey = authkey
+        self.connections = []
+        self.processes = {}
+        self.shard_names = []
+        self.owners = {}
+
+        if addresses is None:
+            addresses = [None] * num_shards
+        for address in addresses:
+            self.add_shard(address=address, authkey=authkey)
+
+    def __len__(self):
+        return len(self.owners)
+
+    def __contains__(self, name):
+        return name in self.owners
+
+    def names(self) -> list:
+        return list(self.owners.keys())
+
+    def _call(self, shard_ind: int, *command):
+        self.connections[shard_ind].send(command)
+        return self.connections[shard_ind].recv()
+
+    def add_shard(self, address: tuple = None, authkey: bytes = None):
+        """
+        Add a shard (a local worker process or a remote one) and move part of identities to it.
+        :param address: Address of a remote shard. None - start a local worker process.
+        :param authkey: Secret key of the remote shard. Default: authkey of the gallery.
+        :return:
+        """
+        shard_ind = len(self.connections)
+        if address is None:
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_local_worker, args=(child_conn,), daemon=True)
+            process.start()
+            child_conn.close()
+            self.processes[shard_ind] = process
+            self.connections.append(parent_conn)
+        else:
+            authkey = self.authkey if authkey is None else authkey
+            assert authkey, "Remote shards need a secret authkey"
+            self.connections.append(Client(address, authkey=authkey))
+
+        # Remote shard can already hold identities
+        self.shard_names.append(set(self._call(shard_ind, 'identities')))
+        for name in self.shard_names[shard_ind]:
+            self.owners[name] = shard_ind
+        self._rebalance()
+
+    def add(self, name: str, embedding):
+        """Enroll an identity (or replace its embedding)."""
+        vector = _to_vector(embedding)
+        if name in self.owners:
+            self._call(self.owners[name], 'add', name, vector)
+            return
+        shard_ind = min(range(len(self.shard_names)), key=lambda ind: len(self.shard_names[ind]))
+        self._place(shard_ind, name, vector)
+        self._rebalance()
+
+    def _place(self, shard_ind: int, name: str, vector: np.ndarray):
+        self._call(shard_ind, 'add', name, vector)
+        self.owners[name] = shard_ind
+        self.shard_names[shard_ind].add(name)
+
+    def remove(self, name: str) -> np.ndarray:
+        """Remove an identity, returns its embedding."""
+        shard_ind = self.owners.pop(name)
+        self.shard_names[shard_ind].discard(name)
+        return self._call(shard_ind, 'pop', name)
+
+    def clear(self):
+        """Remove all identities (shards stay connected)."""
+        for name in self.names():
+            self.remove(name)
+
+    def _rebalance(self):
+        """Move identities from the largest shard to the smallest one while shards are unbalanced."""
+        while True:
+            sizes = [len(names) for names in self.shard_names]
+            largest = sizes.index(max(sizes))
+            smallest = sizes.index(min(sizes))
+            if sizes[largest] - sizes[smallest] <= 1 or sizes[largest] <= sizes[smallest] * self.rebalance_ratio:
+                return
+            name = next(iter(self.shard_names[largest]))
+            self._place(smallest, name, self.remove(name))
+
+    def query(self, embedding, k: int = 1) -> list[tuple[str, float]]:
+        """
+        Scatter-gather search of the nearest identities.
+        :param embedding: Embedding of a face.
+        :param k: Num of nearest identities.
+        :return: List of (name, distance) sorted by distance.
+        """
+        vector = _to_vector(embedding)
+        for conn in self.connections:
+            conn.send(('query', vector, k))
+        candidates = [candidate for conn in self.connections for candidate in conn.recv()]
+        return [(name, distance) for distance, name in heapq.nsmallest(k, candidates)]
+
+    def to_dict(self) -> dict:
+        """All identities and their embeddings (gathered from all shards)."""
+        gathered = {}
+        for shard_ind in range(len(self.connections)):
+            gathered.update(self._call(shard_ind, 'items'))
+        return gathered
+
+    def close(self):
+        """Stop local worker processes and disconnect from remote shards."""
+        for shard_ind in self.processes:
+            self.connections[shard_ind].send(('stop',))
+        for conn in self.connections:
+            conn.close()
+        for process in self.processes.values():
+            process.join()
+        self.connections.clear()
+        self.processes.clear()
+        self.shard_names.clear()
+        self.owners.clear()
@@ -39,6 +39,23 @@ def get_hash(hash_object: str,
     return hash_func(hash_object.encode('utf-8')).hexdigest()
 
 
+def get_file_hash(path: str,
+                  hash_method: str = 'sha256',
+                  chunk_size: int = 1 << 20) -> str:
+    """
+    Hash code of a file (for example to check that model's weights weren't changed).
+    :param path: path to the file.
+    :param hash_method: method of hash coding (look at 'get_hash' for available ones).
+    :param chunk_size: the file is read by chunks of this size.
+    :return: Hash code of the file.
+    """
+    hash_func = hashlib.new(hash_method)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hash_func.update(chunk)
+    return hash_func.hexdigest()
+
+
 def save(saving_object, path):
     with open(path, 'wb') as f:
         pickle.dump(saving_object, f)
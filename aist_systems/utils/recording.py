@@ -0,0 +1,222 @@
+"""
+    Recording of alarm clips: frames before and after an event are kept in RAM and written to a clip on a trigger.
+"""
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+from time import time, perf_counter
+import cv2
+import numpy as np
+from aist_systems.utils import only_digits
+
+
+class PreEventBuffer:
+    """
+    Per-camera ring buffer of JPEG-encoded frames with a fixed memory budget.
+    Frames are encoded in a separate thread, clips are streamed to another one that writes them,
+    so the loop never waits for them.
+
+    The budget covers the ring and frames of clips waiting to be written. If the writer is slower than the camera,
+    the ring is shortened first and then new frames are dropped (look at 'dropped').
+
+    To use it:
+        recorder = PreEventBuffer(pre_seconds=10, post_seconds=5)
+        face_recognizer.launch(recorder=recorder)
+        recorder.close()
+        print(recorder.clips)
+    """
+    def __init__(self,
+                 name: str = "camera",
+                 output_dir: str = "clips",
+                 pre_seconds: float = 10.0,
+                 post_seconds: float = 5.0,
+                 memory_budget_mb: float = 64.0,
+                 jpeg_quality: int = 80,
+                 max_clip_seconds: float = 60.0,
+                 fourcc: str = 'mp4v',
+                 extension: str = '.mp4',
+                 queue_size: int = 16):
+        """
+        :param name: Name of the camera (used in names of clips).
+        :param output_dir: Directory for clips.
+        :param pre_seconds: How many seconds before an event are saved.
+        :param post_seconds: How many seconds after an event are saved.
+        :param memory_budget_mb: Max size of encoded frames in RAM (the ring and clips waiting to be written).
+        The oldest frames of the ring are dropped first.
+        :param jpeg_quality: Quality of JPEG encoding (0-100).
+        :param max_clip_seconds: If events keep coming, a clip is closed after this time.
+        :param fourcc: Codec of clips ('mp4v', 'avc1' for H.264 if your OpenCV supports it, 'MJPG'...).
+        :param extension: Extension of clips.
+        :param queue_size: How many raw frames can wait for encoding. If encoding is slower, new frames are dropped.
+        """
+        self.name = name
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.jpeg_quality = jpeg_quality
+        self.max_clip_seconds = max_clip_seconds
+        self.fourcc = fourcc
+        self.extension = extension
+
+        self.clips = []
+        self.dropped = 0
+        self._frames = deque()
+        self._bytes = 0
+        self._event = None
+        self._last_timestamp = None
+        self._last_frame_time = perf_counter()
+        self._triggers = deque()
+        self._raw = queue.Queue(maxsize=queue_size)
+        self._clips_queue = queue.Queue()
+        # Bytes of frames sent to the writer but not written yet
+        self._pending_bytes = 0
+        self._pending = threading.Condition()
+        self._stop = threading.Event()
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._encoder = threading.Thread(target=self._encode_loop, daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._encoder.start()
+        self._writer.start()
+
+    def push(self, image: np.ndarray, timestamp: float = None) -> bool:
+        """
+        Give a frame to the buffer (never blocks).
+        :param image: Frame.
+        :param timestamp: Time of the frame. Default: current time.
+        :return: False if the frame was dropped because the encoder is busy.
+        """
+        timestamp = time() if timestamp is None else timestamp
+        self._last_timestamp = timestamp
+        try:
+            self._raw.put_nowait((timestamp, image))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def trigger(self, reason: str = "event", timestamp: float = None):
+        """
+        Save a clip around this moment (pre_seconds before and post_seconds after).
+        If a clip is already being recorded, it's extended.
+        :param reason: Reason of the event (written to the clip's name).
+        :param timestamp: Time of the event. Default: time of the last pushed frame.
+        :return:
+        """
+        if timestamp is None:
+            timestamp = time() if self._last_timestamp is None else self._last_timestamp
+        self._triggers.append((timestamp, reason))
+
+    def _append(self, frame: tuple[float, bytes]):
+        """Add an encoded frame to the ring. The same tuple is kept, so it can be recognized in clips."""
+        timestamp, encoded = frame
+        self._frames.append(frame)
+        self._bytes += len(encoded)
+        while self._frames and (self._bytes + self._pending_bytes > self.memory_budget
+                                or timestamp - self._frames[0][0] > self.pre_seconds):
+            self._bytes -= len(self._frames.popleft()[1])
+
+    def _send(self, kind: str, payload=None):
+        """Give a message to the writer. Waits while frames waiting to be written don't fit the budget."""
+        size = sum(len(encoded) for _, encoded in payload) if kind == 'frames' else 0
+        with self._pending:
+            while self._pending_bytes and self._pending_bytes + size > self.memory_budget:
+                self._pending.wait(0.1)
+            self._pending_bytes += size
+        self._clips_queue.put((kind, payload))
+
+    def _fps(self) -> float:
+        """Fps of the camera measured on the ring."""
+        duration = self._frames[-1][0] - self._frames[0][0] if self._frames else 0
+        return (len(self._frames) - 1) / duration if duration > 0 else 25.0
+
+    def _open_events(self):
+        while self._triggers:
+            timestamp, reason = self._triggers.popleft()
+            if self._event is not None:
+                self._event['until'] = max(self._event['until'], timestamp + self.post_seconds)
+                continue
+            frames = [frame for frame in self._frames if frame[0] >= timestamp - self.pre_seconds]
+            self._event = {'start': timestamp,
+                           'until': timestamp + self.post_seconds,
+                           'last_frame': frames[-1] if frames else None}
+            self._send('open', (reason, self._fps()))
+            self._send('frames', frames)
+
+    def _close_event(self):
+        self._send('close')
+        self._event = None
+
+    def _encode_loop(self):
+        while not self._stop.is_set() or not self._raw.empty():
+            try:
+                timestamp, image = self._raw.get(timeout=0.1)
+            except queue.Empty:
+                self._open_events()
+                # No frames come, so don't wait for the rest of the clip
+                if self._event is not None and perf_counter() - self._last_frame_time > self.post_seconds:
+                    self._close_event()
+                continue
+            self._last_frame_time = perf_counter()
+            flag, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not flag:
+                continue
+            frame = (timestamp, encoded.tobytes())
+            self._append(frame)
+            self._open_events()
+            if self._event is not None:
+                if self._event['last_frame'] is not frame:
+                    self._send('frames', [frame])
+                    self._event['last_frame'] = frame
+                if timestamp >= self._event['until'] or timestamp - self._event['start'] >= self.max_clip_seconds:
+                    self._close_event()
+
+        self._open_events()
+        if self._event is not None:
+            self._close_event()
+        self._clips_queue.put(None)
+
+    def _write_loop(self):
+        clip = None
+        while True:
+            message = self._clips_queue.get()
+            if message is None:
+                return
+            kind, payload = message
+            if kind == 'open':
+                reason, fps = payload
+                clip = {'reason': reason, 'fps': fps, 'writer': None, 'path': None}
+            elif kind == 'frames':
+                self._write_frames(clip, payload)
+            elif clip['writer'] is not None:
+                clip['writer'].release()
+                self.clips.append(clip['path'])
+
+    def _write_frames(self, clip: dict, frames: list):
+        for timestamp, encoded in frames:
+            image = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+            if clip['writer'] is None:
+                name, reason = ("".join(char if char.isalnum() else "_" for char in str(text))
+                                for text in (self.name, clip['reason']))
+                clip['path'] = os.path.join(self.output_dir,
+                                            f"{name}_{only_digits(str(datetime.now()))}_{reason}{self.extension}")
+                height, width = image.shape[:2]
+                clip['writer'] = cv2.VideoWriter(clip['path'], cv2.VideoWriter_fourcc(*self.fourcc), clip['fps'],
+                                                 (width, height))
+            clip['writer'].write(image)
+        with self._pending:
+            self._pending_bytes -= sum(len(encoded) for _, encoded in frames)
+            self._pending.notify_all()
+
+    def memory_usage(self) -> int:
+        """Bytes of encoded frames in RAM (the ring and clips waiting to be written)."""
+        return self._bytes + self._pending_bytes
+
+    def close(self):
+        """Encode the rest of frames, write unfinished clips and stop threads."""
+        self._stop.set()
+        self._encoder.join()
+        self._writer.join()
@@ -0,0 +1,219 @@
+"""
+    Typed results of live loops and non-blocking iteration over them.
+"""
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+
+@dataclass
+class FaceResult:
+    """Result of face recognition on one frame."""
+    camera: object
+    timestamp: float
+    frame_index: int
+    boxes: list = field(default_factory=list)
+    identities: list = field(default_factory=list)
+    distances: list = field(default_factory=list)
+    latency: dict = field(default_factory=dict)
+
+    @property
+    def wrong_person(self) -> bool:
+        return 'Wrong person' in self.identities
+
+
+@dataclass
+class DetectionResult:
+    """Result of object detection on one frame. Boxes are normalized (xyxyn)."""
+    camera: object
+    timestamp: float
+    frame_index: int
+    classes: list = field(default_factory=list)
+    boxes: list = field(default_factory=list)
+    events: list = field(default_factory=list)
+    latency: dict = field(default_factory=dict)
+
+
+@dataclass
+class DepthResult(DetectionResult):
+    """
+    Result of Watcher3D: detection plus relative depth of boxes.
+    With the default depth model it's relative inverse depth: larger value = closer object (not meters).
+    """
+    relative_depth: list = field(default_factory=list)
+    depth_frame: int | None = None
+
+
+_END = object()
+_EMPTY = object()
+
+
+class ResultBuffer:
+    """
+    Bounded thread-safe buffer between a capture loop and a consumer.
+
+    Overflow policies (what happens when the consumer is slow and the buffer is full):
+        'drop_oldest' - the oldest result is dropped (consumer always gets fresh results);
+        'drop_newest' - the new result is dropped;
+        'block' - capture loop waits for the consumer.
+    """
+    overflow_policies = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self,
+                 maxsize: int = 64,
+                 overflow: str = 'drop_oldest'):
+        """
+        :param maxsize: Max num of results in the buffer.
+        :param overflow: 'drop_oldest', 'drop_newest' or 'block'.
+        """
+        assert overflow in self.overflow_policies, f"Overflow policy '{overflow}' is not available"
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+
+        self._items = deque()
+        self._error = None
+        self._condition = threading.Condition()
+
+    def put(self, item) -> bool:
+        """Put a result. Returns False if it was dropped or the buffer is closed."""
+        with self._condition:
+            if self.closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.overflow == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                if self.overflow == 'drop_oldest':
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self.closed:
+                        self._condition.wait()
+                    if self.closed:
+                        return False
+            self._items.append(item)
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout: float = None):
+        """
+        Get the next result (waits for it).
+        :param timeout: Max time (seconds) to wait. None - wait until a result comes or the buffer is closed.
+        :return: The result, a special end marker when the buffer is closed and empty
+        or a special empty marker when the timeout has passed.
+        If the capture loop failed, its exception is raised here.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self.closed, timeout=timeout)
+            if self._items:
+                item = self._items.popleft()
+                self._condition.notify_all()
+                return item
+            if not self.closed:
+                return _EMPTY
+            if self._error is not None:
+                raise self._error
+            return _END
+
+    def close(self, error: BaseException = None):
+        with self._condition:
+            self.closed = True
+            if error is not None:
+                self._error = error
+            self._condition.notify_all()
+
+
+class BackgroundResults:
+    """
+    Runs a loop (generator of results) in a separate thread and gives its results via a bounded buffer,
+    so a slow consumer never stalls capture.
+
+    Works as an iterator and as an async iterator:
+        with face_recognizer.results(cam=0) as results:
+            for result in results:
+                ...
+        async with watcher.results(cam_index=0) as results:
+            async for result in results:
+                ...
+    Stop it with 'close()' / 'aclose()' or use it as a context manager, otherwise the camera stays open.
+    """
+    # How often (seconds) an async consumer checks the buffer, so a cancelled task doesn't block a thread for long
+    poll_interval = 0.1
+
+    def __init__(self,
+                 generator,
+                 buffer_size: int = 64,
+                 overflow: str = 'drop_oldest'):
+        """
+        :param generator: Generator of results.
+        :param buffer_size: Max num of results waiting for the consumer.
+        :param overflow: What to do when the buffer is full: 'drop_oldest', 'drop_newest' or 'block'.
+        """
+        self.buffer = ResultBuffer(maxsize=buffer_size, overflow=overflow)
+        self._thread = threading.Thread(target=self._produce, args=(generator,), daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        """Num of results dropped because the consumer was slow."""
+        return self.buffer.dropped
+
+    def _produce(self, generator):
+        error = None
+        try:
+            for item in generator:
+                if self.buffer.closed:
+                    break
+                self.buffer.put(item)
+        except Exception as exception:
+            error = exception
+        finally:
+            generator.close()
+            self.buffer.close(error)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.buffer.get()
+        if item is _END:
+            raise StopIteration
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        try:
+            item = _EMPTY
+            while item is _EMPTY:
+                item = await loop.run_in_executor(None, self.buffer.get, self.poll_interval)
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        if item is _END:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        """Stop the loop (it stops after the current frame) and release its sources."""
+        self.buffer.close()
+
+    async def aclose(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
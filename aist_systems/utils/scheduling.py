@@ -0,0 +1,204 @@
+"""
+    Load shedding for loops that work with several cameras.
+"""
+import threading
+from collections import deque
+from time import perf_counter, time
+
+
+class LoadScheduler:
+    """
+    Keeps cameras of one loop inside their latency budgets.
+
+    Latency of a camera is the time between two processed frames of this camera
+    (how old is the freshest result of this camera), so skipped frames make it bigger.
+    When some camera is over its budget, the scheduler degrades the camera with the lowest priority
+    among cameras inside their budgets: skips its frames and lowers detection resolution.
+    A camera that is over its budget is never degraded (skipping its frames would only make its results older).
+    When all cameras are inside their budgets again, cameras are recovered starting from the highest priority.
+
+    Every decision is saved in 'decisions' (and printed if you want), current state is in 'status()'.
+
+    To use it:
+        scheduler = LoadScheduler()
+        scheduler.add_camera(0, target_latency=0.1, priority=10)
+        scheduler.add_camera(1, target_latency=0.5, priority=0)
+        recognizer.single_thread(cameras=[0, 1], scheduler=scheduler)
+    """
+    # Degradation levels: process every N-th frame and scale of detection resolution.
+    default_levels = ({'every': 1, 'scale': 1.0},
+                      {'every': 2, 'scale': 1.0},
+                      {'every': 2, 'scale': 0.5},
+                      {'every': 4, 'scale': 0.5},
+                      {'every': 8, 'scale': 0.5},
+                      {'every': 16, 'scale': 0.5})
+
+    def __init__(self,
+                 default_latency: float = 0.2,
+                 default_priority: int = 0,
+                 decide_every: float = 1.0,
+                 recover_ratio: float = 0.7,
+                 recover_delay: float = 5.0,
+                 smoothing: float = 0.2,
+                 forget_after: float = 5.0,
+                 levels: tuple = None,
+                 print_decisions: bool = True,
+                 max_decisions: int = 1000):
+        """
+        :param default_latency: Latency budget (seconds) of cameras that weren't added via 'add_camera'.
+        :param default_priority: Priority of cameras that weren't added via 'add_camera'. More = more important.
+        :param decide_every: How often (seconds) the scheduler can change degradation levels.
+        :param recover_ratio: Cameras are recovered only when all latencies are less than budget * recover_ratio.
+        :param recover_delay: Min time (seconds) after the last degradation before recovering (stops flapping).
+        :param smoothing: Smoothing factor of latencies' moving average.
+        :param forget_after: Cameras that weren't visited for this time (seconds) are ignored in decisions
+        (for example a finished video or a lost stream).
+        :param levels: Your own degradation levels (look at 'LoadScheduler.default_levels').
+        :param print_decisions: True - if you want to see decisions in your console.
+        :param max_decisions: How many last decisions are kept in RAM.
+        """
+        self.default_latency = default_latency
+        self.default_priority = default_priority
+        self.decide_every = decide_every
+        self.recover_ratio = recover_ratio
+        self.recover_delay = recover_delay
+        self.smoothing = smoothing
+        self.forget_after = forget_after
+        self.levels = self.default_levels if levels is None else levels
+        self.print_decisions = print_decisions
+
+        self.cameras = {}
+        self.decisions = deque(maxlen=max_decisions)
+        self._last_decision = perf_counter()
+        self._last_degradation = None
+        self._lock = threading.Lock()
+
+    def add_camera(self,
+                   camera,
+                   target_latency: float = None,
+                   priority: int = None):
+        """
+        Set budget and priority of a camera.
+        :param camera: Camera's name in a loop (its index, url, path or FrameSource's name).
+        :param target_latency: Latency budget in seconds.
+        :param priority: Priority of the camera. Cameras with less priority are degraded first.
+        :return:
+        """
+        with self._lock:
+            self.cameras[camera] = {'target_latency': self.default_latency if target_latency is None
+                                    else target_latency,
+                                    'priority': self.default_priority if priority is None else priority,
+                                    'level': 0,
+                                    'latency': None,
+                                    'last_processed': None,
+                                    'last_visit': None,
+                                    'visits': 0,
+                                    'skipped': 0}
+
+    def remove_camera(self, camera):
+        """
+        Forget a camera (for example when its source is finished).
+        :param camera: Camera's index.
+        :return:
+        """
+        with self._lock:
+            self.cameras.pop(camera, None)
+
+    def visit(self, camera) -> tuple[bool, float]:
+        """
+        Call it every time a loop reads a frame of a camera.
+        :param camera: Camera's index.
+        :return: (process, scale): process - False if the frame has to be skipped,
+        scale - scale of detection resolution for this frame.
+        """
+        if camera not in self.cameras:
+            self.add_camera(camera)
+
+        with self._lock:
+            state = self.cameras[camera]
+            now = perf_counter()
+            state['last_visit'] = now
+            if now - self._last_decision >= self.decide_every:
+                self._last_decision = now
+                self._rebalance(now)
+
+            level = self.levels[state['level']]
+            process = state['visits'] % level['every'] == 0
+            state['visits'] += 1
+            if not process:
+                state['skipped'] += 1
+                return process, level['scale']
+
+            if state['last_processed'] is not None:
+                interval = now - state['last_processed']
+                if state['latency'] is None:
+                    state['latency'] = interval
+                else:
+                    state['latency'] += self.smoothing * (interval - state['latency'])
+            state['last_processed'] = now
+            return process, level['scale']
+
+    @staticmethod
+    def _current_latency(state: dict, now: float) -> float | None:
+        """Smoothed latency, but not less than the age of the freshest result."""
+        if state['latency'] is None:
+            return None
+        return max(state['latency'], now - state['last_processed'])
+
+    def _decide(self, camera, action: str):
+        state = self.cameras[camera]
+        state['level'] += 1 if action == 'degrade' else -1
+        latency = self._current_latency(state, perf_counter())
+        decision = {'time': time(),
+                    'camera': camera,
+                    'action': action,
+                    'level': state['level'],
+                    'latency': latency,
+                    'target_latency': state['target_latency'],
+                    **self.levels[state['level']]}
+        self.decisions.append(decision)
+        if self.print_decisions:
+            latency = "unknown" if latency is None else f"{latency:.3f}s"
+            print(f"Scheduler: {action} camera {camera} to level {state['level']} "
+                  f"(every {decision['every']} frame, scale {decision['scale']}, "
+                  f"latency {latency} / budget {state['target_latency']:.3f}s)")
+
+    def _rebalance(self, now: float):
+        # Cameras that aren't visited anymore would look infinitely late
+        active = {camera: state for camera, state in self.cameras.items()
+                  if state['last_visit'] is not None and now - state['last_visit'] <= self.forget_after}
+        latencies = {camera: self._current_latency(state, now) for camera, state in active.items()}
+        measured = {camera: latency for camera, latency in latencies.items() if latency is not None}
+        if not measured:
+            return
+        over_budget = {camera for camera, latency in measured.items()
+                       if latency > self.cameras[camera]['target_latency']}
+
+        if over_budget:
+            candidates = [camera for camera, state in active.items()
+                          if camera not in over_budget and state['level'] < len(self.levels) - 1]
+            if candidates:
+                camera = min(candidates, key=lambda cam: (self.cameras[cam]['priority'], self.cameras[cam]['level']))
+                self._decide(camera, 'degrade')
+                self._last_degradation = self._last_decision
+        elif self._last_degradation is not None \
+                and self._last_decision - self._last_degradation < self.recover_delay:
+            return
+        elif all(latency < self.cameras[camera]['target_latency'] * self.recover_ratio
+                 for camera, latency in measured.items()):
+            candidates = [camera for camera, state in active.items() if state['level'] > 0]
+            if candidates:
+                camera = max(candidates, key=lambda cam: (self.cameras[cam]['priority'], -self.cameras[cam]['level']))
+                self._decide(camera, 'recover')
+
+    def status(self) -> dict:
+        """Current state of every camera: level, latency, budget, priority and num of skipped frames."""
+        with self._lock:
+            now = perf_counter()
+            return {camera: {'level': state['level'],
+                             'latency': self._current_latency(state, now),
+                             'target_latency': state['target_latency'],
+                             'priority': state['priority'],
+                             'skipped': state['skipped'],
+                             **self.levels[state['level']]}
+                    for camera, state in self.cameras.items()}
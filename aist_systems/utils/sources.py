@@ -0,0 +1,326 @@
+"""
+    Frame sources: cameras, video files, image directories and network streams.
+    Every source decodes frames ahead in a separate thread into a bounded buffer.
+"""
+import os
+import queue
+import threading
+from time import sleep, time, perf_counter
+from typing import NamedTuple
+import cv2
+import numpy as np
+
+
+class Frame(NamedTuple):
+    image: np.ndarray
+    timestamp: float
+    index: int
+
+
+class FrameSource:
+    """
+    Base class of frame sources.
+
+    Can be used like cv2.VideoCapture:
+        source = open_source("video.mp4")
+        while source.grab():
+            flag, frame = source.retrieve()
+
+    Or with timestamps:
+        for frame in open_source("rtsp://camera/stream"):
+            print(frame.index, frame.timestamp, frame.image.shape)
+    """
+    # Live sources always give the newest frame (older ones are dropped) when consumer is slow,
+    # recorded ones wait for him.
+    live = False
+
+    def __init__(self,
+                 buffer_size: int = 8,
+                 realtime: bool = False,
+                 prefetch: bool = True,
+                 name: int | str = None):
+        """
+        :param buffer_size: How many decoded frames can wait in the buffer.
+        :param realtime: True - recorded sources are replayed with their real speed.
+        False - as fast as possible. Live sources are always realtime.
+        :param prefetch: True - decode frames ahead in a separate thread.
+        :param name: Name of the source in logs and results. Default: camera's index, url or path.
+        """
+        self.name = type(self).__name__ if name is None else name
+        self.buffer_size = buffer_size
+        self.realtime = realtime
+        self.prefetch = prefetch
+        self.finished = False
+        self.dropped = 0
+
+        self._index = 0
+        self._grabbed = None
+        self._pace_start = None
+        self._buffer = queue.Queue(maxsize=buffer_size)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._open()
+        if prefetch:
+            self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+            self._thread.start()
+
+    def _open(self):
+        """Open the source."""
+
+    def _next(self) -> tuple[np.ndarray, float] | None:
+        """Decode the next frame. Returns (image, timestamp) or None at the end of the source."""
+        raise NotImplementedError
+
+    def _close(self):
+        """Close the source."""
+
+    def _decode_loop(self):
+        try:
+            while not self._stop.is_set():
+                decoded = self._next()
+                if decoded is None:
+                    break
+                frame = Frame(decoded[0], decoded[1], self._index)
+                self._index += 1
+
+                if self.live:
+                    while True:
+                        try:
+                            self._buffer.put_nowait(frame)
+                            break
+                        except queue.Full:
+                            try:
+                                self._buffer.get_nowait()
+                                self.dropped += 1
+                            except queue.Empty:
+                                pass
+                else:
+                    while not self._stop.is_set():
+                        try:
+                            self._buffer.put(frame, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+        finally:
+            # Even if decoding failed, the consumer has to know that the source is finished
+            self._buffer.put(None)
+
+    def _latest(self, frame: Frame | None) -> Frame | None:
+        """The newest decoded frame (older ones are dropped), so live sources don't lag behind."""
+        while frame is not None:
+            try:
+                newer = self._buffer.get_nowait()
+            except queue.Empty:
+                break
+            if newer is None:
+                # The source is finished, the next read will see it
+                self._buffer.put(None)
+                break
+            self.dropped += 1
+            frame = newer
+        return frame
+
+    def _pace(self, frame: Frame):
+        """Wait until the frame's time comes (for realtime replay of recorded sources)."""
+        if self._pace_start is None:
+            self._pace_start = (perf_counter(), frame.timestamp)
+            return
+        start_time, start_timestamp = self._pace_start
+        delay = (frame.timestamp - start_timestamp) - (perf_counter() - start_time)
+        if delay > 0:
+            sleep(delay)
+
+    def read_frame(self) -> Frame | None:
+        """The next frame with its timestamp and index. None - if the source is finished."""
+        if self.finished:
+            return None
+        if self.prefetch:
+            frame = self._buffer.get()
+            if self.live:
+                frame = self._latest(frame)
+        else:
+            decoded = self._next()
+            frame = None if decoded is None else Frame(decoded[0], decoded[1], self._index)
+            self._index += 1
+
+        if frame is None:
+            self.finished = True
+            return None
+        if self.realtime and not self.live:
+            self._pace(frame)
+        return frame
+
+    def read(self) -> tuple[bool, np.ndarray | None]:
+        """Same as cv2.VideoCapture.read."""
+        frame = self.read_frame()
+        if frame is None:
+            return False, None
+        return True, frame.image
+
+    def grab(self) -> bool:
+        """Same as cv2.VideoCapture.grab."""
+        self._grabbed = self.read_frame()
+        return self._grabbed is not None
+
+    def retrieve(self) -> tuple[bool, np.ndarray | None]:
+        """Same as cv2.VideoCapture.retrieve."""
+        if self._grabbed is None:
+            return False, None
+        return True, self._grabbed.image
+
+    def __iter__(self):
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def release(self):
+        """Stop decoding and close the source."""
+        self._stop.set()
+        if self._thread is not None:
+            # Unblock the decoding thread if it waits for a place in the buffer
+            while self._thread.is_alive():
+                try:
+                    self._buffer.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        self._close()
+        self.finished = True
+
+
+class _CaptureSource(FrameSource):
+    """Source read via cv2.VideoCapture."""
+    def __init__(self, target, **kwargs):
+        self.target = target
+        self.capture = None
+        kwargs.setdefault('name', target)
+        super().__init__(**kwargs)
+
+    def _open(self):
+        self.capture = cv2.VideoCapture(self.target)
+
+    def _next(self):
+        flag, image = self.capture.read()
+        if not flag:
+            return None
+        return image, time()
+
+    def _close(self):
+        self.capture.release()
+
+
+class CameraSource(_CaptureSource):
+    """Camera device by its index."""
+    live = True
+
+    def __init__(self, camera_index: int = 0, **kwargs):
+        """
+        :param camera_index: If you have several cameras, you can choose which one you will use.
+        :param kwargs: Params of FrameSource.
+        """
+        super().__init__(camera_index, **kwargs)
+
+
+class StreamSource(_CaptureSource):
+    """Network stream (RTSP / HTTP url). Reconnects if the stream is lost."""
+    live = True
+
+    def __init__(self,
+                 url: str,
+                 reconnect_attempts: int = 5,
+                 reconnect_delay: float = 1.0,
+                 **kwargs):
+        """
+        :param url: Url of the stream.
+        :param reconnect_attempts: How many times to reconnect before the source is finished.
+        :param reconnect_delay: Delay (seconds) between reconnections.
+        :param kwargs: Params of FrameSource.
+        """
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        super().__init__(url, **kwargs)
+
+    def _next(self):
+        for attempt in range(self.reconnect_attempts + 1):
+            decoded = super()._next()
+            if decoded is not None:
+                return decoded
+            if attempt < self.reconnect_attempts and not self._stop.is_set():
+                print(f"Stream {self.target} is lost, reconnecting...")
+                self.capture.release()
+                sleep(self.reconnect_delay)
+                self._open()
+        return None
+
+
+class VideoFileSource(_CaptureSource):
+    """Recorded video file. Timestamps are positions of frames in the video."""
+    def __init__(self, path: str, **kwargs):
+        """
+        :param path: Path to the video.
+        :param kwargs: Params of FrameSource.
+        """
+        super().__init__(path, **kwargs)
+
+    def _next(self):
+        flag, image = self.capture.read()
+        if not flag:
+            return None
+        return image, self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+
+class ImageDirectorySource(FrameSource):
+    """Directory with images, they are read in sorted order."""
+    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+    def __init__(self, path: str, fps: float = 25.0, **kwargs):
+        """
+        :param path: Path to the directory.
+        :param fps: Images are treated as frames of a video with this fps (for timestamps and realtime replay).
+        :param kwargs: Params of FrameSource.
+        """
+        self.path = path
+        self.fps = fps
+        self.paths = []
+        self._position = 0
+        kwargs.setdefault('name', path)
+        super().__init__(**kwargs)
+
+    def _open(self):
+        self.paths = sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                            if name.lower().endswith(self.image_extensions))
+
+    def _next(self):
+        while self._position < len(self.paths):
+            image = cv2.imread(self.paths[self._position])
+            timestamp = self._position / self.fps
+            self._position += 1
+            if image is not None:
+                return image, timestamp
+            print(f"Failed to read {self.paths[self._position - 1]}")
+        return None
+
+
+def open_source(source, **kwargs) -> FrameSource:
+    """
+    Make a frame source from anything you have:
+        0, "0"                 - camera's index
+        "rtsp://...", "http://..." - network stream
+        "path/to/directory"    - directory with images
+        "path/to/video.mp4"    - video file
+        FrameSource            - returned as is
+    :param source: Source of frames.
+    :param kwargs: Params of FrameSource (buffer_size, realtime, prefetch, name).
+    :return: FrameSource
+    """
+    if isinstance(source, FrameSource):
+        return source
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return CameraSource(int(source), **kwargs)
+    if "://" in source:
+        return StreamSource(source, **kwargs)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, **kwargs)
+    return VideoFileSource(source, **kwargs)
@@ -0,0 +1,185 @@
+"""
+    Disk storage for streams of depth maps.
+    Depth maps are written to growable memory-mapped arrays, so they don't stay in RAM.
+"""
+import json
+import os
+from time import time
+import numpy as np
+
+
+class _GrowableMemmap:
+    """Memory-mapped array of items with the same shape, that grows (doubles) on disk when it's full."""
+    def __init__(self,
+                 path: str,
+                 dtype,
+                 item_shape: tuple,
+                 capacity: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.item_shape = tuple(item_shape)
+        self.capacity = capacity
+        self.array = None
+        self._map(capacity)
+
+    def _map(self, capacity: int):
+        item_size = self.dtype.itemsize * int(np.prod(self.item_shape, dtype=np.int64))
+        with open(self.path, 'ab') as f:
+            f.truncate(capacity * item_size)
+        self.capacity = capacity
+        self.array = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity, *self.item_shape))
+
+    def set(self, position: int, value):
+        if position >= self.capacity:
+            self.array.flush()
+            self.array = None
+            self._map(max(position + 1, 2 * self.capacity))
+        self.array[position] = value
+
+    def close(self, count: int):
+        """Flush and cut unused capacity."""
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        item_size = self.dtype.itemsize * int(np.prod(self.item_shape, dtype=np.int64))
+        with open(self.path, 'ab') as f:
+            f.truncate(count * item_size)
+
+
+class DepthMapStorage:
+    """
+    Lazy handle of depth maps written by DepthMapSink. Nothing is loaded until you slice it:
+        storage = DepthMapStorage("depth_maps")
+        len(storage)
+        storage[10]          # one depth map (float32)
+        storage[100:200:10]  # several depth maps
+        storage.timestamps   # timestamps of all depth maps
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Directory where DepthMapSink wrote depth maps.
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.count = self.meta['count']
+        self.shape = tuple(self.meta['shape'] or ())
+        self.dtype = self.meta['dtype']
+
+        self.raw = self._open('data.bin', self.dtype, self.shape)
+        self.timestamps = self._open('timestamps.bin', np.float64, ())
+        self.quantization = self._open('quantization.bin', np.float32, (2,)) if self.dtype == 'uint16' else None
+
+    def _open(self, name: str, dtype, item_shape: tuple):
+        if self.count == 0:
+            return np.zeros((0, *item_shape), dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=(self.count, *item_shape))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item) -> np.ndarray:
+        data = np.asarray(self.raw[item], dtype=np.float32)
+        if self.quantization is not None:
+            offset_scale = np.asarray(self.quantization[item])
+            offset, scale = offset_scale[..., 0], offset_scale[..., 1]
+            extra_dims = (1,) * len(self.shape)
+            data = data * scale.reshape(scale.shape + extra_dims) + offset.reshape(offset.shape + extra_dims)
+        return data
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self[position]
+
+
+class DepthMapSink:
+    """
+    Streams depth maps to disk (memory-mapped arrays that grow when they are full).
+
+    To use it:
+        sink = DepthMapSink("depth_maps", dtype='float16')
+        sink.write(depth_map)
+        storage = sink.close()  # DepthMapStorage
+    """
+    available_dtypes = ['float32', 'float16', 'uint16']
+
+    def __init__(self,
+                 path: str,
+                 dtype: str = 'float32',
+                 depth_range: tuple[float, float] = None,
+                 capacity: int = 256,
+                 save_meta_every: int = 100):
+        """
+        :param path: Directory for the depth maps (will be created).
+        :param dtype: 'float32', 'float16' or 'uint16' (quantized, 4x less than float32).
+        :param depth_range: (min, max) of depth values for 'uint16'. None - range of every depth map is used.
+        :param capacity: Initial capacity (num of depth maps), it doubles when it's full.
+        :param save_meta_every: Metadata is saved every N depth maps, so data can be read even if a process dies.
+        """
+        assert dtype in self.available_dtypes, f"Dtype '{dtype}' is not available"
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = dtype
+        self.depth_range = depth_range
+        self.capacity = capacity
+        self.save_meta_every = save_meta_every
+
+        self.count = 0
+        self.shape = None
+        self._data = None
+        self._timestamps = None
+        self._quantization = None
+
+    def _open(self, shape: tuple):
+        self.shape = tuple(shape)
+        self._data = _GrowableMemmap(os.path.join(self.path, 'data.bin'), self.dtype, self.shape, self.capacity)
+        self._timestamps = _GrowableMemmap(os.path.join(self.path, 'timestamps.bin'), np.float64, (), self.capacity)
+        if self.dtype == 'uint16':
+            self._quantization = _GrowableMemmap(os.path.join(self.path, 'quantization.bin'),
+                                                 np.float32, (2,), self.capacity)
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({'count': self.count,
+                       'shape': self.shape,
+                       'dtype': self.dtype}, f)
+
+    def _quantize(self, depth_map: np.ndarray) -> tuple[np.ndarray, float, float]:
+        if self.depth_range is not None:
+            min_value, max_value = self.depth_range
+        else:
+            min_value, max_value = float(depth_map.min()), float(depth_map.max())
+        scale = (max_value - min_value) / 65535 or 1.0
+        quantized = np.clip(np.rint((depth_map - min_value) / scale), 0, 65535).astype(np.uint16)
+        return quantized, min_value, scale
+
+    def write(self, depth_map: np.ndarray, timestamp: float = None):
+        """
+        Write one depth map.
+        :param depth_map: Depth map (all of them must have the same shape).
+        :param timestamp: Time of the frame. Default: current time.
+        :return:
+        """
+        if self._data is None:
+            self._open(depth_map.shape)
+        assert depth_map.shape == self.shape, f"Depth map's shape {depth_map.shape} != {self.shape}"
+
+        if self.dtype == 'uint16':
+            quantized, offset, scale = self._quantize(depth_map)
+            self._data.set(self.count, quantized)
+            self._quantization.set(self.count, (offset, scale))
+        else:
+            self._data.set(self.count, depth_map)
+        self._timestamps.set(self.count, time() if timestamp is None else timestamp)
+        self.count += 1
+
+        if self.count % self.save_meta_every == 0:
+            self._save_meta()
+
+    def close(self) -> DepthMapStorage:
+        """Flush everything to disk and get a lazy handle of written depth maps."""
+        for array in (self._data, self._timestamps, self._quantization):
+            if array is not None:
+                array.close(self.count)
+        self._save_meta()
+        return DepthMapStorage(self.path)
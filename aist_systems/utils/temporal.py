@@ -0,0 +1,99 @@
+"""
+    Temporal propagation of depth maps.
+    The full depth model runs only on keyframes, depth of frames between them is propagated cheaply.
+"""
+import cv2
+import numpy as np
+
+
+class DepthPropagator:
+    """
+    Chooses keyframes (by interval or scene change) and propagates depth of the last keyframe to other frames.
+
+    Propagation methods:
+        'flow' - depth of the keyframe is warped with dense optical flow (static regions stay the same);
+        'hold' - depth of the keyframe is used as is.
+
+    To use it:
+        propagator = DepthPropagator(keyframe_every=5)
+        for frame in frames:
+            depth_map, is_keyframe = propagator.update(frame, estimate=depth_estimator.from_ndarray)
+    """
+    available_methods = ('flow', 'hold')
+
+    def __init__(self,
+                 keyframe_every: int = 5,
+                 scene_change_threshold: float = None,
+                 method: str = 'flow'):
+        """
+        :param keyframe_every: Max num of frames between keyframes.
+        :param scene_change_threshold: If mean absolute difference between a frame and the keyframe
+        (0 - same, 1 - totally different) is more than this value, the frame becomes a keyframe. None - don't check.
+        :param method: 'flow' or 'hold'.
+        """
+        assert method in self.available_methods, f"Method '{method}' is not available"
+        self.keyframe_every = keyframe_every
+        self.scene_change_threshold = scene_change_threshold
+        self.method = method
+
+        self.keyframes = 0
+        self.frames = 0
+        self._key_depth = None
+        self._key_gray = None
+        self._since_keyframe = 0
+        self._grid = None
+
+    def reset(self):
+        """Forget the keyframe (for example when another stream starts)."""
+        self._key_depth = None
+        self._key_gray = None
+
+    def _gray(self, image: np.ndarray, shape: tuple) -> np.ndarray:
+        """Grayscale frame with the size of depth maps."""
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(image, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+
+    def _is_keyframe(self, gray: np.ndarray) -> bool:
+        if self._since_keyframe >= self.keyframe_every:
+            return True
+        if self.scene_change_threshold is not None:
+            difference = cv2.absdiff(gray, self._key_gray).mean() / 255
+            return difference > self.scene_change_threshold
+        return False
+
+    def _warp(self, gray: np.ndarray) -> np.ndarray:
+        # Flow from the current frame to the keyframe: where every pixel of the current frame was on the keyframe
+        flow = cv2.calcOpticalFlowFarneback(gray, self._key_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        height, width = gray.shape
+        if self._grid is None or self._grid[0].shape != (height, width):
+            self._grid = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        map_x = self._grid[0] + flow[..., 0]
+        map_y = self._grid[1] + flow[..., 1]
+        key_depth = self._key_depth.reshape(height, width)
+        warped = cv2.remap(key_depth, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return warped.reshape(self._key_depth.shape)
+
+    def update(self, image: np.ndarray, estimate) -> tuple[np.ndarray, bool]:
+        """
+        Get depth map of the next frame.
+        :param image: Frame.
+        :param estimate: Function that runs the full depth model on a frame (for example DepthEstimator.from_ndarray).
+        :return: (depth map, True if the frame was a keyframe)
+        """
+        self.frames += 1
+        gray = None
+        if self._key_depth is not None:
+            gray = self._gray(image, self._key_depth.shape)
+            if not self._is_keyframe(gray):
+                self._since_keyframe += 1
+                if self.method == 'hold':
+                    return self._key_depth, False
+                return self._warp(gray), False
+
+        self._key_depth = np.asarray(estimate(image), dtype=np.float32)
+        self._key_gray = self._gray(image, self._key_depth.shape) if gray is None \
+            or gray.shape != self._key_depth.shape[:2] else gray
+        self._since_keyframe = 1
+        self.keyframes += 1
+        return self._key_depth, True
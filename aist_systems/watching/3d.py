@@ -1,3 +1,207 @@
 """
     Module for working with watchers but with 3D cameras.
-"""
\ No newline at end of file
+
+    Name of this module starts with a digit, so use it via 'aist_systems.watching.Watcher3D'.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+import aist_systems
+import aist_systems.watching as watching
+from aist_systems.utils import decode, only_digits
+from aist_systems.utils.sources import Frame, FrameSource, open_source
+from aist_systems.utils.results import DepthResult
+
+
+class Watcher3D(watching.Watcher2D):
+    """
+    Watcher that captures a frame once and runs detection and depth estimation on it concurrently.
+    Every detected box gets its relative depth (median of the depth map inside the box).
+    The default depth model gives relative inverse depth: larger value = closer object (not meters).
+
+    To start using it:
+        watcher = aist_systems.watching.Watcher3D(depth_every=5)
+        watcher.start()
+
+    'results' gives DepthResults (DetectionResults with relative depth of boxes).
+    """
+    result_type = DepthResult
+
+    def __init__(self,
+                 yolo_version: str = "yolov8n.pt",
+                 depth_every: int = 1,
+                 depth_only_with_detections: bool = False,
+                 sync_depth: bool = True,
+                 depth_estimator: aist_systems.DepthEstimator = None,
+                 **kwargs):
+        """
+        :param yolo_version: You can specify version of YOLO (detection model).
+        :param depth_every: Depth is estimated every N-th frame, other frames use the last depth map.
+        :param depth_only_with_detections: True - depth is estimated only for frames with detected objects.
+        :param sync_depth: True - wait for the depth map of the current frame.
+        False - never wait, use the last finished depth map (the fastest, but depth can be a bit late).
+        :param depth_estimator: Your DepthEstimator (if you already have it).
+        :param kwargs: Other params of Watcher2D (backend, imgsz, cache_dir).
+        """
+        super().__init__(yolo_version=yolo_version, **kwargs)
+        self.depth_estimator = aist_systems.DepthEstimator() if depth_estimator is None else depth_estimator
+        self.depth_every = depth_every
+        self.depth_only_with_detections = depth_only_with_detections
+        self.sync_depth = sync_depth
+
+        self.last_depth = None
+        self.last_depth_index = None
+        self._depth_future = None
+        self._depth_future_index = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def box_depth(depth_map: np.ndarray,
+                  xyxyn_box: list,
+                  central_part: float = 0.5) -> float | None:
+        """
+        Relative depth of an object: median of the depth map inside the central part of its box.
+        With the default depth model larger value = closer object.
+        :param depth_map: Depth map.
+        :param xyxyn_box: Normalized box (x1, y1, x2, y2).
+        :param central_part: Part of the box used (edges of boxes usually contain background).
+        :return: Depth value or None if the box is empty.
+        """
+        height, width = depth_map.shape[:2]
+        x1, y1, x2, y2 = xyxyn_box
+        margin_x = (x2 - x1) * (1 - central_part) / 2
+        margin_y = (y2 - y1) * (1 - central_part) / 2
+        region = depth_map[int((y1 + margin_y) * height):int(np.ceil((y2 - margin_y) * height)),
+                           int((x1 + margin_x) * width):int(np.ceil((x2 - margin_x) * width))]
+        if region.size == 0:
+            return None
+        return float(np.median(region))
+
+    def _reset_depth(self):
+        """Forget depth of the previous stream (the pending depth map too)."""
+        if self._depth_future is not None and not self._depth_future.cancel():
+            # It's already running, wait for it so it doesn't overlap with the next stream
+            self._depth_future.exception()
+        self._depth_future, self._depth_future_index = None, None
+        self.last_depth, self.last_depth_index = None, None
+
+    def _collect_depth(self, wait: bool):
+        if self._depth_future is not None and (wait or self._depth_future.done()):
+            self.last_depth = self._depth_future.result()
+            self.last_depth_index = self._depth_future_index
+            self._depth_future = None
+
+    def _submit_depth(self, image: np.ndarray, frame_index: int):
+        if self._depth_future is not None:
+            return
+        if self.last_depth_index is not None and frame_index - self.last_depth_index < self.depth_every:
+            return
+        self._depth_future = self._executor.submit(self.depth_estimator.from_ndarray, image)
+        self._depth_future_index = frame_index
+
+    def process_frame(self,
+                      image: np.ndarray,
+                      frame_index: int = 0,
+                      **predict_kwargs) -> dict:
+        """
+        Detection and depth estimation of one frame.
+        :param image: Frame.
+        :param frame_index: Index of the frame in the stream (for 'depth_every').
+        :param predict_kwargs: Params of detection model (show, conf...).
+        :return: Dict with classes, bounding boxes, relative depth of boxes and index of the frame the depth map was made from.
+        """
+        self._collect_depth(wait=False)
+        if not self.depth_only_with_detections:
+            # Depth model works in the background while the detection model works here
+            self._submit_depth(image, frame_index)
+
+        data = self._data_perf(self._predict(image, classes=self.model_classes, **predict_kwargs))
+        if self.depth_only_with_detections and data['classes']:
+            self._submit_depth(image, frame_index)
+
+        self._collect_depth(wait=self.sync_depth)
+        if self.last_depth is None:
+            data['relative_depth'] = [None] * len(data['classes'])
+        else:
+            data['relative_depth'] = [self.box_depth(self.last_depth, box) for box in data['xyxyn_bboxes']]
+        data['depth_frame'] = self.last_depth_index
+        return data
+
+    def _frame_data(self, frame: Frame, scale: float = 1.0, **predict_kwargs) -> dict:
+        # process_frame always uses 'self.model_classes'
+        predict_kwargs.pop('classes', None)
+        return self.process_frame(frame.image, frame_index=frame.index, scale=scale, **predict_kwargs)
+
+    def _make_result(self, data: dict, **fields) -> DepthResult:
+        return DepthResult(classes=data['classes'],
+                           boxes=data['xyxyn_bboxes'],
+                           relative_depth=data['relative_depth'],
+                           depth_frame=data['depth_frame'],
+                           **fields)
+
+    def _results(self, *args, **kwargs):
+        self._reset_depth()
+        yield from super()._results(*args, **kwargs)
+
+    def predict_from_bytes(self,
+                           image_bytes: bytes,
+                           show: bool = True) -> dict:
+        """
+        If you have an image in bytes, you can get prediction of the model via this function.
+        :param image_bytes: Your image's bytes.
+        :param show: If you want to be shown a result of the model - 'True'
+        :return: Dict represents classes, bounding boxes and relative depth of boxes.
+        """
+        self._reset_depth()
+        image = decode(image_bytes=image_bytes)
+        return self.process_frame(image, show=show)
+
+    def start(self,
+              show: bool = True,
+              cam_index: int | str | FrameSource = 0,
+              write_logs: bool = True,
+              save_logs_every: int = 1000,
+              use_cuda=False,
+              max_iter: int = None):
+        """
+        Main function of Watcher3D class.
+        :param show: True - if you want to look at model results at realtime. False - if you don't.
+        :param cam_index: If you have several cameras, you can specify which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
+        :param write_logs: Watcher3D can write information about detection model predictions to JSON files.
+        :param save_logs_every: How many times Watcher3D will write predictions to RAM before save it as a file.
+        :param use_cuda: if ypu have a GPU, you can specify it in this param.
+        :param max_iter: Max num of frames.
+        :return: Stats of the run: FPS and mean latency of a frame.
+        """
+        if use_cuda:
+            self._use_cuda()
+        saving_lib = only_digits(str(datetime.now()))
+        if write_logs:
+            os.mkdir(saving_lib)
+        camera = open_source(cam_index)
+        self._reset_depth()
+        latencies = []
+        start_time = perf_counter()
+
+        for frame in camera:
+            frame_start = perf_counter()
+            data = self.process_frame(frame.image, frame_index=frame.index, show=show)
+            latencies.append(perf_counter() - frame_start)
+            if write_logs:
+                self.log[str(datetime.now())] = data
+                # Saving logs
+                if len(self.log.keys()) == save_logs_every:
+                    self.save_log(
+                        path_to_save=os.path.join(saving_lib, only_digits(str(datetime.now())) + '.json'),
+                        clear_after_save=True)
+            if max_iter is not None and len(latencies) == max_iter:
+                break
+        camera.release()
+
+        total_time = perf_counter() - start_time
+        return {'frames': len(latencies),
+                'fps': len(latencies) / total_time if total_time else 0.0,
+                'mean_latency': float(np.mean(latencies)) if latencies else 0.0}
@@ -1,9 +1,16 @@
 from ultralytics import YOLO
-import cv2
 from datetime import datetime
+import importlib
 import os
 import json
-from aist_systems.utils import decode, only_digits
+import shutil
+from pathlib import Path
+from time import perf_counter
+from aist_systems.utils import decode, only_digits, get_file_hash
+from aist_systems.watching.tracking import ObjectTracker
+from aist_systems.utils.sources import Frame, FrameSource, open_source
+from aist_systems.utils.recording import PreEventBuffer
+from aist_systems.utils.results import BackgroundResults, DetectionResult
 
 
 class Watcher2D:
@@ -16,13 +23,31 @@ class Watcher2D:
         watcher = aist_systems.watching.Watcher2D()
         watcher.start()
     """
+    available_backends = {'torch': None,
+                          'onnx': '.onnx',
+                          'openvino': '_openvino_model'}
+    # Type of records given by 'results'
+    result_type = DetectionResult
+
     def __init__(self,
-                 yolo_version: str = "yolov8n.pt"):
+                 yolo_version: str = "yolov8n.pt",
+                 backend: str = 'torch',
+                 imgsz: int = 640,
+                 cache_dir: str = "exported_models"):
         """
         :param yolo_version: You can specify version of YOLO (detection model).
         Default = yolov8n.pt
+        :param backend: 'torch' - run PyTorch model.
+        'onnx' or 'openvino' - export the model once and run it via ONNX Runtime or OpenVINO (faster on CPU).
+        :param imgsz: Input size of the detection model. Exported models work only with this size.
+        :param cache_dir: Directory where exported models are kept, so they are exported only once.
         """
+        assert backend in self.available_backends, f"Backend '{backend}' is not available"
+        self.backend = backend
+        self.imgsz = imgsz
         self.detection_model = YOLO(yolo_version)
+        if backend != 'torch':
+            self.detection_model = YOLO(self._export_model(yolo_version, cache_dir), task='detect')
         self.classes = {0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 4: 'airplane', 5: 'bus', 6: 'train',
                         7: 'truck', 8: 'boat', 9: 'traffic light', 10: 'fire hydrant', 11: 'stop sign',
                         12: 'parking meter', 13: 'bench', 14: 'bird', 15: 'cat', 16: 'dog', 17: 'horse', 18: 'sheep',
@@ -30,6 +55,40 @@ class Watcher2D:
         self.model_classes = list(self.classes.keys())
         self.log = {}
 
+    def _export_model(self,
+                      yolo_version: str,
+                      cache_dir: str) -> str:
+        """Export the model to 'self.backend' format or take it from cache.
+
+        Exported artifacts are keyed by hash of the weights and input size.
+        """
+        weights_path = getattr(self.detection_model, 'ckpt_path', None) or yolo_version
+        weights_hash = get_file_hash(weights_path)[:16]
+        suffix = self.available_backends[self.backend]
+        cached_path = os.path.join(cache_dir, f"{Path(weights_path).stem}_{weights_hash}_{self.imgsz}{suffix}")
+
+        if not os.path.exists(cached_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            exported_path = self.detection_model.export(format=self.backend, imgsz=self.imgsz)
+            shutil.move(exported_path, cached_path)
+        return cached_path
+
+    def _use_cuda(self):
+        if self.backend == 'torch':
+            self.detection_model.cuda()
+        else:
+            print(f"CUDA is not used with '{self.backend}' backend")
+
+    def _predict(self, image, scale: float = 1.0, **kwargs):
+        """Run detection model on one image.
+
+        'scale' lowers detection resolution. Exported models have fixed input size, so it's ignored for them.
+        """
+        imgsz = self.imgsz
+        if scale != 1.0 and self.backend == 'torch':
+            imgsz = max(32, int(self.imgsz * scale) // 32 * 32)
+        return self.detection_model.predict(image, imgsz=imgsz, **kwargs)[0]
+
     @staticmethod
     def _data_perf(detection_output) -> dict:
         output = detection_output.boxes
@@ -40,6 +99,119 @@ class Watcher2D:
                           'xyxyn_bboxes': bboxes}
         return returning_dict
 
+    @staticmethod
+    def _log_entry(data: dict,
+                   events: list = None,
+                   frame_index: int = 0,
+                   write_boxes_every: int = 0) -> dict | None:
+        """Make a log entry of a frame. Without tracking (events is None) it's the whole frame data."""
+        if events is None:
+            return data
+        entry = {}
+        if events:
+            entry['events'] = events
+        if write_boxes_every and frame_index % write_boxes_every == 0:
+            entry.update(data)
+        return entry or None
+
+    def _write_log(self,
+                   result: DetectionResult,
+                   tracking: bool,
+                   write_boxes_every: int,
+                   save_logs_every: int,
+                   saving_lib: str,
+                   with_camera: bool = False):
+        """Write a result to 'self.log' and save the log every 'save_logs_every' entries."""
+        entry = self._log_entry({'classes': result.classes, 'xyxyn_bboxes': result.boxes},
+                                events=result.events if tracking else None,
+                                frame_index=result.frame_index,
+                                write_boxes_every=write_boxes_every)
+        if entry is not None:
+            if with_camera:
+                entry['camera'] = result.camera
+            self.log[str(datetime.now())] = entry
+        # Saving logs
+        if len(self.log.keys()) == save_logs_every:
+            self.save_log(
+                path_to_save=os.path.join(saving_lib, only_digits(str(datetime.now())) + '.json'),
+                clear_after_save=True)
+
+    def _process(self,
+                 frame: Frame,
+                 camera,
+                 tracker: ObjectTracker = None,
+                 recorder: PreEventBuffer = None,
+                 trigger_classes: list = None,
+                 scale: float = 1.0,
+                 **predict_kwargs) -> DetectionResult:
+        """Detection (and tracking) of one frame."""
+        start_time = perf_counter()
+        data = self._frame_data(frame, scale=scale, **predict_kwargs)
+        latency = perf_counter() - start_time
+        events = [] if tracker is None else tracker.update(data, timestamp=frame.timestamp)
+        if recorder is not None:
+            reason = self._alarm_reason(data, trigger_classes)
+            if reason is not None:
+                recorder.trigger(reason, timestamp=frame.timestamp)
+        return self._make_result(data,
+                                 camera=camera,
+                                 timestamp=frame.timestamp,
+                                 frame_index=frame.index,
+                                 events=events,
+                                 latency={'detection': latency})
+
+    def _frame_data(self, frame: Frame, scale: float = 1.0, **predict_kwargs) -> dict:
+        """Output of the model on one frame (dict like '_data_perf' gives)."""
+        return self._data_perf(self._predict(frame.image, scale=scale, **predict_kwargs))
+
+    def _make_result(self, data: dict, **fields) -> DetectionResult:
+        return self.result_type(classes=data['classes'], boxes=data['xyxyn_bboxes'], **fields)
+
+    def _results(self,
+                 cam_index: int | str | FrameSource = 0,
+                 show: bool = False,
+                 tracker: ObjectTracker = None,
+                 recorder: PreEventBuffer = None,
+                 trigger_classes: list = None,
+                 flush_tracker: bool = True,
+                 verbose: bool = False):
+        """Generator of DetectionResults of every frame of a camera. The camera is released when it's closed.
+
+        With 'flush_tracker' the last result carries only 'exit' events of objects still in view at the end.
+        'verbose' - detection model prints a line for every frame (slows the loop down).
+        """
+        camera = open_source(cam_index)
+        frame = None
+        try:
+            for frame in camera:
+                if recorder is not None:
+                    recorder.push(frame.image, timestamp=frame.timestamp)
+                yield self._process(frame, camera.name,
+                                    tracker=tracker,
+                                    recorder=recorder,
+                                    trigger_classes=trigger_classes,
+                                    show=show,
+                                    classes=self.model_classes,
+                                    verbose=verbose)
+            if tracker is not None and flush_tracker and frame is not None:
+                events = tracker.flush()
+                if events:
+                    yield self.result_type(camera=camera.name,
+                                           timestamp=frame.timestamp,
+                                           frame_index=frame.index,
+                                           events=events)
+        finally:
+            camera.release()
+
+    def _alarm_reason(self,
+                      data: dict,
+                      trigger_classes: list = None) -> str | None:
+        """Name of the first detected watched class (any class if trigger_classes is None)."""
+        for cls in data['classes']:
+            if trigger_classes is None or int(cls) in trigger_classes:
+                return self.classes.get(int(cls), str(int(cls)))
+        return None
+
     def show_all_classes(self):
         """
         You can look at all available classes and their indexes.
@@ -88,41 +260,115 @@ class Watcher2D:
         :return: Dict represents classes, bounding boxes, and the time when prediction was made.
         """
         image = decode(image_bytes=image_bytes)
-        output = self.detection_model.predict(image, show=show)[0]
+        output = self._predict(image, show=show)
         return self._data_perf(output)
 
     def start(self,
               show: bool = True,
-              cam_index: int = 0,
+              cam_index: int | str | FrameSource = 0,
               write_logs: bool = True,
               save_logs_every: int = 1000,
-              use_cuda=False):
+              use_cuda=False,
+              use_tracking: bool = False,
+              write_boxes_every: int = 0,
+              tracker: ObjectTracker = None,
+              recorder: PreEventBuffer = None,
+              trigger_classes: list = None):
         """
         Main function of Watcher2D class.
         You can look at detection model's predictions at realtime.
         :param show: True - if you want to look at model results at realtime. False - if you don't.
         :param cam_index: If you have several cameras, you can specify which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
         :param write_logs: Watcher2D can write information about detection model predictions to JSON files.
         :param save_logs_every: How many times Watcher2D will write predictions to RAM before save it as a file.
         :param use_cuda: if ypu have a GPU, you can specify it in this param.
+        :param use_tracking: True - if you want to write only enter/exit/dwell events of tracked objects
+        instead of boxes of every frame.
+        :param write_boxes_every: With tracking, boxes of every N-th frame are written too. 0 - never.
+        :param tracker: You can pass your own ObjectTracker (for example with other thresholds).
+        :param recorder: PreEventBuffer - if you want to save clips around detections of watched classes.
+        :param trigger_classes: Indexes of classes that trigger a clip. None - any detected class.
         :return:
         """
         if use_cuda:
-            self.detection_model.cuda()
+            self._use_cuda()
+        if not use_tracking:
+            tracker = None
+        elif tracker is None:
+            tracker = ObjectTracker()
         saving_lib = only_digits(str(datetime.now()))
         if write_logs:
             os.mkdir(saving_lib)
-        camera = cv2.VideoCapture(cam_index)
-
-        while camera.grab():
-            response, frame = camera.retrieve()
-            if response:
-                current_output = self.detection_model.predict(frame, show=show, classes=self.model_classes)[0]
-                if write_logs:
-                    self.log[str(datetime.now())] = self._data_perf(current_output)
-                    # Saving logs
-                    if len(self.log.keys()) == save_logs_every:
-                        self.save_log(
-                            path_to_save=os.path.join(saving_lib, only_digits(str(datetime.now())) + '.json'),
-                            clear_after_save=True)
-        camera.release()
+
+        for result in self._results(cam_index,
+                                    show=show,
+                                    tracker=tracker,
+                                    recorder=recorder,
+                                    trigger_classes=trigger_classes,
+                                    flush_tracker=False,
+                                    verbose=True):
+            if write_logs:
+                self._write_log(result,
+                                tracking=tracker is not None,
+                                write_boxes_every=write_boxes_every,
+                                save_logs_every=save_logs_every,
+                                saving_lib=saving_lib)
+        if write_logs and tracker is not None:
+            events = tracker.flush()
+            if events:
+                self.log[str(datetime.now())] = {'events': events}
+
+    def results(self,
+                cam_index: int | str | FrameSource = 0,
+                show: bool = False,
+                use_cuda=False,
+                use_tracking: bool = False,
+                tracker: ObjectTracker = None,
+                recorder: PreEventBuffer = None,
+                trigger_classes: list = None,
+                buffer_size: int = 64,
+                overflow: str = 'drop_oldest') -> BackgroundResults:
+        """
+        Watcher2D works in a separate thread and gives a DetectionResult of every frame
+        (camera, timestamp, classes, boxes, tracking events, latency). Nothing is written to 'self.log'.
+            with watcher.results() as results:
+                for result in results:
+                    ...
+        Or in async code:
+            async with watcher.results() as results:
+                async for result in results:
+                    ...
+        :param cam_index: If you have several cameras, you can specify which one you will use.
+        Also it can be a path to a video or a directory with images, stream's url or FrameSource.
+        :param show: True - if you want to look at model results at realtime. False - if you don't.
+        :param use_cuda: if ypu have a GPU, you can specify it in this param.
+        :param use_tracking: True - if you want to get enter/exit/dwell events of tracked objects.
+        :param tracker: You can pass your own ObjectTracker (for example with other thresholds).
+        :param recorder: PreEventBuffer - if you want to save clips around detections of watched classes.
+        :param trigger_classes: Indexes of classes that trigger a clip. None - any detected class.
+        :param buffer_size: Max num of results waiting for you.
+        :param overflow: What to do if you are slower than the camera:
+        'drop_oldest', 'drop_newest' or 'block' (camera waits for you).
+        :return: Iterator (and async iterator) of results. Stop it with 'close()'.
+        """
+        if use_cuda:
+            self._use_cuda()
+        if not use_tracking:
+            tracker = None
+        elif tracker is None:
+            tracker = ObjectTracker()
+        return BackgroundResults(self._results(cam_index,
+                                               show=show,
+                                               tracker=tracker,
+                                               recorder=recorder,
+                                               trigger_classes=trigger_classes),
+                                 buffer_size=buffer_size,
+                                 overflow=overflow)
+
+
+def __getattr__(name):
+    # Module '3d' can't be imported with usual syntax, so Watcher3D is loaded lazily
+    if name == 'Watcher3D':
+        return importlib.import_module('aist_systems.watching.3d').Watcher3D
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
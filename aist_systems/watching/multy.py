@@ -1,6 +1,10 @@
-import cv2
 import aist_systems.watching as watching
 from aist_systems.utils import only_digits
+from aist_systems.watching.tracking import ObjectTracker
+from aist_systems.utils.scheduling import LoadScheduler
+from aist_systems.utils.sources import open_source
+from aist_systems.utils.recording import PreEventBuffer
+from aist_systems.utils.results import BackgroundResults
 from datetime import datetime
 import os
 
@@ -23,46 +27,154 @@ class Watcher2D(watching.Watcher2D):
         return returning_dict
 
     def single_thread(self,
-                      cameras: list[int],
+                      cameras: list,
                       show: bool = False,
                       write_logs: bool = True,
                       save_logs_every: int = 500,
                       threshold: float = 0.5,
-                      use_cuda=False):
+                      use_cuda=False,
+                      use_tracking: bool = False,
+                      write_boxes_every: int = 0,
+                      scheduler: LoadScheduler = None,
+                      recorders: dict[int | str, PreEventBuffer] = None,
+                      trigger_classes: list = None):
         """Use this function if you have several cameras,
         but you need to use just 1 thread.
 
-        :param cameras: Specify which cameras you will use.
+        :param cameras: Specify which cameras you will use
+        (or paths to videos or directories with images, streams' urls, FrameSources).
         :param show: True - if you want to look at model results at realtime. False - if you don't.
         :param write_logs: Watcher2D can write information about detection model predictions to JSON files.
         :param save_logs_every: How many times Watcher2D will write predictions to RAM before save it as a file.
         :param use_cuda: if ypu have a GPU, you can specify it in this param.
         :param threshold: you can specify threshold meaning model's confidence.
+        :param use_tracking: True - if you want to write only enter/exit/dwell events of tracked objects
+        (every camera has its own tracker) instead of boxes of every frame.
+        :param write_boxes_every: With tracking, boxes of every N-th frame of a camera are written too. 0 - never.
+        :param scheduler: LoadScheduler that keeps cameras inside their latency budgets
+        (skips frames and lowers detection resolution of less important cameras when the loop is overloaded).
+        :param recorders: {camera's name: PreEventBuffer} - if you want to save clips around detections of watched classes.
+        :param trigger_classes: Indexes of classes that trigger a clip. None - any detected class.
         :return:
         """
         if use_cuda:
-            self.detection_model.cuda()
+            self._use_cuda()
         saving_lib = only_digits(str(datetime.now()))
         if write_logs:
             os.mkdir(saving_lib)
 
-        devices = [cv2.VideoCapture(current_camera) for current_camera in cameras]
+        for result in self._cameras_results(cameras,
+                                            show=show,
+                                            threshold=threshold,
+                                            use_tracking=use_tracking,
+                                            scheduler=scheduler,
+                                            recorders=recorders,
+                                            trigger_classes=trigger_classes,
+                                            flush_trackers=False,
+                                            verbose=True):
+            if write_logs:
+                self._write_log(result,
+                                tracking=use_tracking,
+                                write_boxes_every=write_boxes_every,
+                                save_logs_every=save_logs_every,
+                                saving_lib=saving_lib,
+                                with_camera=True)
 
-        while True:
-            for camera_ind, current_device in zip(cameras, devices):
-                response, frame = current_device.read()
-                if response:
-                    current_output = self.detection_model.predict(frame,
-                                                                  show=show,
-                                                                  classes=self.model_classes,
-                                                                  conf=threshold)[0]
-                    if write_logs:
-                        self.log[str(datetime.now())] = self._data_perf(current_output, camera_index=camera_ind)
-                        # Saving logs
-                        if len(self.log.keys()) == save_logs_every:
-                            self.save_log(
-                                path_to_save=os.path.join(saving_lib, only_digits(str(datetime.now())) + '.json'),
-                                clear_after_save=True)
+    def _cameras_results(self,
+                         cameras: list,
+                         show: bool = False,
+                         threshold: float = 0.5,
+                         use_tracking: bool = False,
+                         scheduler: LoadScheduler = None,
+                         recorders: dict[int | str, PreEventBuffer] = None,
+                         trigger_classes: list = None,
+                         flush_trackers: bool = True,
+                         verbose: bool = False):
+        """Generator of DetectionResults of several cameras (round-robin). Cameras are released when it's closed.
+        'verbose' - detection model prints a line for every frame (slows the loop down).
+        """
+        devices = [open_source(current_camera) for current_camera in cameras]
+        trackers = [ObjectTracker() if use_tracking else None for _ in cameras]
+        last_frames = {}
+        if recorders is None:
+            recorders = {}
+
+        try:
+            while not all(current_device.finished for current_device in devices):
+                for position, current_device in enumerate(devices):
+                    frame = current_device.read_frame()
+                    if frame is None:
+                        if scheduler is not None:
+                            scheduler.remove_camera(current_device.name)
+                        continue
+                    last_frames[position] = frame
+                    recorder = recorders.get(current_device.name)
+                    if recorder is not None:
+                        recorder.push(frame.image, timestamp=frame.timestamp)
+                    scale = 1.0
+                    if scheduler is not None:
+                        process, scale = scheduler.visit(current_device.name)
+                        if not process:
+                            continue
+                    yield self._process(frame, current_device.name,
+                                        tracker=trackers[position],
+                                        recorder=recorder,
+                                        trigger_classes=trigger_classes,
+                                        scale=scale,
+                                        show=show,
+                                        classes=self.model_classes,
+                                        conf=threshold,
+                                        verbose=verbose)
+            if use_tracking and flush_trackers:
+                for position, frame in last_frames.items():
+                    events = trackers[position].flush()
+                    if events:
+                        yield self.result_type(camera=devices[position].name,
+                                               timestamp=frame.timestamp,
+                                               frame_index=frame.index,
+                                               events=events)
+        finally:
+            for current_device in devices:
+                current_device.release()
+
+    def results_from_cameras(self,
+                             cameras: list,
+                             show: bool = False,
+                             threshold: float = 0.5,
+                             use_cuda=False,
+                             use_tracking: bool = False,
+                             scheduler: LoadScheduler = None,
+                             recorders: dict[int | str, PreEventBuffer] = None,
+                             trigger_classes: list = None,
+                             buffer_size: int = 64,
+                             overflow: str = 'drop_oldest') -> BackgroundResults:
+        """Same as 'Watcher2D.results', but for several cameras.
+        'camera' of every DetectionResult is the camera's index, url, path or FrameSource's name.
+
+        :param cameras: Specify which cameras you will use
+        (or paths to videos or directories with images, streams' urls, FrameSources).
+        :param show: True - if you want to look at model results at realtime. False - if you don't.
+        :param threshold: you can specify threshold meaning model's confidence.
+        :param use_cuda: if ypu have a GPU, you can specify it in this param.
+        :param use_tracking: True - if you want to get enter/exit/dwell events (every camera has its own tracker).
+        :param scheduler: LoadScheduler that keeps cameras inside their latency budgets.
+        :param recorders: {camera's name: PreEventBuffer} - if you want to save clips around detections of watched classes.
+        :param trigger_classes: Indexes of classes that trigger a clip. None - any detected class.
+        :param buffer_size: Max num of results waiting for you.
+        :param overflow: What to do if you are slower than cameras: 'drop_oldest', 'drop_newest' or 'block'.
+        :return: Iterator (and async iterator) of results. Stop it with 'close()'.
+        """
+        if use_cuda:
+            self._use_cuda()
+        return BackgroundResults(self._cameras_results(cameras,
+                                                       show=show,
+                                                       threshold=threshold,
+                                                       use_tracking=use_tracking,
+                                                       scheduler=scheduler,
+                                                       recorders=recorders,
+                                                       trigger_classes=trigger_classes),
+                                 buffer_size=buffer_size,
+                                 overflow=overflow)
 
     def multy_thread(self):
         pass
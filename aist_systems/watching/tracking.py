@@ -0,0 +1,154 @@
+"""
+    Tracking layer for watchers.
+    Turns per-frame detections into persistent tracks and compact events.
+"""
+from time import time
+
+
+def box_iou(first_box: list, second_box: list) -> float:
+    """Intersection over union of two xyxy boxes."""
+    inter_w = min(first_box[2], second_box[2]) - max(first_box[0], second_box[0])
+    inter_h = min(first_box[3], second_box[3]) - max(first_box[1], second_box[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    first_area = (first_box[2] - first_box[0]) * (first_box[3] - first_box[1])
+    second_area = (second_box[2] - second_box[0]) * (second_box[3] - second_box[1])
+    return intersection / (first_area + second_area - intersection)
+
+
+class ObjectTracker:
+    """
+    Assigns persistent track ids to detections of Watcher2D and emits events instead of per-frame boxes.
+
+    Events are dicts:
+        {'event': 'enter', 'track_id': 3, 'class': 0, 'time': ..., 'box': [...]}
+        {'event': 'dwell', 'track_id': 3, 'class': 0, 'time': ..., 'box': [...], 'duration': 10.2}
+        {'event': 'exit', 'track_id': 3, 'class': 0, 'time': ..., 'box': [...], 'duration': 25.7}
+
+    To use it:
+        tracker = ObjectTracker()
+        events = tracker.update(watcher._data_perf(output))
+    """
+    def __init__(self,
+                 iou_threshold: float = 0.3,
+                 max_missed: int = 15,
+                 min_hits: int = 3,
+                 dwell_every: float = 10.0):
+        """
+        :param iou_threshold: Min IoU between a box and a track to continue this track.
+        :param max_missed: How many frames in a row a track can be missed before 'exit' event.
+        :param min_hits: How many frames an object has to be seen before 'enter' event (filters flickering boxes).
+        :param dwell_every: How often (in seconds) 'dwell' events are emitted for objects that stay in view.
+        None - if you don't need 'dwell' events.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.dwell_every = dwell_every
+
+        self.tracks = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _event(name: str, track_id: int, track: dict, timestamp: float, with_duration: bool = True) -> dict:
+        event = {'event': name,
+                 'track_id': track_id,
+                 'class': track['class'],
+                 'time': timestamp,
+                 'box': track['box']}
+        if with_duration:
+            event['duration'] = timestamp - track['first_seen']
+        return event
+
+    def _match(self, classes: list, bboxes: list) -> dict:
+        """Greedy IoU matching of detections to live tracks of the same class."""
+        candidates = []
+        for det_ind, (cls, box) in enumerate(zip(classes, bboxes)):
+            for track_id, track in self.tracks.items():
+                if track['class'] != cls:
+                    continue
+                iou = box_iou(box, track['box'])
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, det_ind, track_id))
+
+        matches = {}
+        used_tracks = set()
+        for iou, det_ind, track_id in sorted(candidates, reverse=True):
+            if det_ind in matches or track_id in used_tracks:
+                continue
+            matches[det_ind] = track_id
+            used_tracks.add(track_id)
+        return matches
+
+    def update(self, data: dict, timestamp: float = None) -> list[dict]:
+        """
+        Update tracks with detections of one frame.
+        :param data: Output of Watcher2D._data_perf (dict with 'classes' and 'xyxyn_bboxes').
+        :param timestamp: Time of the frame. Default: current time.
+        :return: List of events happened on this frame.
+        """
+        if timestamp is None:
+            timestamp = time()
+        classes, bboxes = data['classes'], data['xyxyn_bboxes']
+        matches = self._match(classes, bboxes)
+        events = []
+
+        for det_ind, (cls, box) in enumerate(zip(classes, bboxes)):
+            if det_ind in matches:
+                track = self.tracks[matches[det_ind]]
+                track['box'] = box
+                track['hits'] += 1
+                track['missed'] = 0
+                track['last_seen'] = timestamp
+            else:
+                self.tracks[self._next_id] = {'class': cls,
+                                              'box': box,
+                                              'hits': 1,
+                                              'missed': 0,
+                                              'first_seen': timestamp,
+                                              'last_seen': timestamp,
+                                              'last_dwell': timestamp,
+                                              'confirmed': False}
+                matches[det_ind] = self._next_id
+                self._next_id += 1
+
+        seen_tracks = set(matches.values())
+        for track_id in list(self.tracks.keys()):
+            track = self.tracks[track_id]
+            if track_id not in seen_tracks:
+                track['missed'] += 1
+                if track['missed'] > self.max_missed:
+                    if track['confirmed']:
+                        events.append(self._event('exit', track_id, track, track['last_seen']))
+                    del self.tracks[track_id]
+                continue
+
+            if not track['confirmed'] and track['hits'] >= self.min_hits:
+                track['confirmed'] = True
+                track['last_dwell'] = timestamp
+                events.append(self._event('enter', track_id, track, timestamp, with_duration=False))
+            elif track['confirmed'] and self.dwell_every is not None \
+                    and timestamp - track['last_dwell'] >= self.dwell_every:
+                track['last_dwell'] = timestamp
+                events.append(self._event('dwell', track_id, track, timestamp))
+        return events
+
+    def flush(self, timestamp: float = None) -> list[dict]:
+        """
+        Close all live tracks (for example when the camera is released).
+        :param timestamp: Time of closing. Default: time when every track was seen last time.
+        :return: 'exit' events for all confirmed tracks.
+        """
+        events = []
+        for track_id, track in self.tracks.items():
+            if track['confirmed']:
+                exit_time = track['last_seen'] if timestamp is None else timestamp
+                events.append(self._event('exit', track_id, track, exit_time))
+        self.tracks.clear()
+        return events
+
+    def active_tracks(self) -> dict:
+        """Confirmed tracks that are in view now: {track_id: {'class': ..., 'box': ...}}."""
+        return {track_id: {'class': track['class'], 'box': track['box']}
+                for track_id, track in self.tracks.items() if track['confirmed']}
@@ -0,0 +1,40 @@
+"""
+    Face detection time with and without the person cascade.
+    Run it on a mostly-empty clip and on a crowded one.
+
+    Usage:
+        python benchmarks/face_cascade.py <path to a clip> [<path to another clip> ...]
+"""
+import sys
+from time import perf_counter
+import numpy as np
+from aist_systems.face import Recognizer
+from aist_systems.face.cascade import PersonCascade
+from aist_systems.utils.sources import open_source
+
+
+def run(*clip_paths: str, max_frames: int = 200):
+    recognizer = Recognizer()
+    cascade = PersonCascade()
+
+    for clip_path in clip_paths:
+        for mode_name, person_cascade in (('full frame', None), ('person cascade', cascade)):
+            recognizer.mtcnn.person_cascade = person_cascade
+            source = open_source(clip_path)
+            latencies, num_of_faces = [], 0
+            for frame in source:
+                start_time = perf_counter()
+                batch_boxes, cropped_images = recognizer.mtcnn.detect_box(frame.image)
+                latencies.append(perf_counter() - start_time)
+                if batch_boxes is not None:
+                    num_of_faces += len(batch_boxes)
+                if len(latencies) == max_frames:
+                    break
+            source.release()
+            print(f"{clip_path} | {mode_name}: {1000 * np.mean(latencies):.1f} ms/frame, "
+                  f"p95 {1000 * np.percentile(latencies, 95):.1f} ms, faces {num_of_faces}")
+        print(f"{clip_path} | cascade: {cascade.report()}")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
@@ -0,0 +1,51 @@
+"""
+    FPS and latency of Watcher3D against running Watcher2D and DepthEstimator separately.
+
+    Usage:
+        python benchmarks/watcher3d.py <path to a recorded clip> [max frames]
+"""
+import sys
+from time import perf_counter
+import numpy as np
+from aist_systems.utils.sources import open_source
+from aist_systems.watching import Watcher2D, Watcher3D
+
+
+def run_separately(watcher: Watcher2D, depth_estimator, clip_path: str, max_frames: int) -> dict:
+    """Two captures, two decodes and serial inference (like two separate scripts on one machine)."""
+    detection_source, depth_source = open_source(clip_path), open_source(clip_path)
+    latencies = []
+    start_time = perf_counter()
+    for frame_index in range(max_frames):
+        frame_start = perf_counter()
+        detection_frame, depth_frame = detection_source.read_frame(), depth_source.read_frame()
+        if detection_frame is None or depth_frame is None:
+            break
+        watcher._predict(detection_frame.image, verbose=False)
+        depth_estimator.from_ndarray(depth_frame.image)
+        latencies.append(perf_counter() - frame_start)
+    total_time = perf_counter() - start_time
+    detection_source.release()
+    depth_source.release()
+    return {'frames': len(latencies), 'fps': len(latencies) / total_time, 'mean_latency': float(np.mean(latencies))}
+
+
+def run(clip_path: str, max_frames: int = 200):
+    max_frames = int(max_frames)
+    watcher = Watcher3D()
+    modes = {'separately': lambda: run_separately(watcher, watcher.depth_estimator, clip_path, max_frames)}
+    for depth_every in (1, 5):
+        for sync_depth in (True, False):
+            def fused(depth_every=depth_every, sync_depth=sync_depth):
+                watcher.depth_every, watcher.sync_depth = depth_every, sync_depth
+                return watcher.start(show=False, cam_index=clip_path, write_logs=False, max_iter=max_frames)
+            modes[f"Watcher3D depth_every={depth_every} sync_depth={sync_depth}"] = fused
+
+    for mode_name, mode in modes.items():
+        stats = mode()
+        print(f"{mode_name}: {stats['frames']} frames, {stats['fps']:.2f} FPS, "
+              f"latency {1000 * stats['mean_latency']:.1f} ms")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
@@ -0,0 +1,60 @@
+"""
+    CPU latency and throughput of Watcher2D with different backends (torch, onnx, openvino).
+
+    Usage:
+        python benchmarks/watching_backends.py <path to an image or a clip> [num of runs] [yolo version]
+"""
+import sys
+from time import perf_counter
+import numpy as np
+from aist_systems.utils.sources import open_source
+from aist_systems.watching import Watcher2D
+
+
+def load_frames(path: str, max_frames: int = 100) -> list:
+    camera = open_source(path)
+    frames = []
+    for frame in camera:
+        frames.append(frame.image)
+        if len(frames) == max_frames:
+            break
+    camera.release()
+    assert frames, f"Failed to read frames from {path}"
+    return frames
+
+
+def run(path: str, num_of_runs: int = 100, yolo_version: str = "yolov8n.pt"):
+    frames = load_frames(path)
+    num_of_runs = int(num_of_runs)
+    reference = None
+
+    for backend in Watcher2D.available_backends:
+        try:
+            watcher = Watcher2D(yolo_version=yolo_version, backend=backend)
+        except Exception as error:
+            print(f"{backend}: unavailable ({error})")
+            continue
+        # Warm up
+        for frame in frames[:5]:
+            watcher._predict(frame, verbose=False)
+
+        latencies = []
+        start_time = perf_counter()
+        for run_ind in range(num_of_runs):
+            frame_start = perf_counter()
+            watcher._predict(frames[run_ind % len(frames)], verbose=False)
+            latencies.append(perf_counter() - frame_start)
+        total_time = perf_counter() - start_time
+
+        data = watcher._data_perf(watcher._predict(frames[0], verbose=False))
+        if reference is None:
+            reference = data
+        same_output = data['classes'] == reference['classes']
+        print(f"{backend}: latency p50 {1000 * np.median(latencies):.1f} ms, "
+              f"p95 {1000 * np.percentile(latencies, 95):.1f} ms, "
+              f"throughput {num_of_runs / total_time:.1f} FPS, "
+              f"same classes as torch: {same_output}")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
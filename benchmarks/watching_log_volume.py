@@ -0,0 +1,53 @@
+"""
+    Log volume and loop time of Watcher2D: per-frame logs vs tracking events.
+
+    Usage:
+        python benchmarks/watching_log_volume.py <path to a recorded clip> [yolo version]
+"""
+import json
+import sys
+from time import perf_counter
+from aist_systems.utils.sources import open_source
+from aist_systems.watching import Watcher2D
+from aist_systems.watching.tracking import ObjectTracker
+
+
+def run(clip_path: str, yolo_version: str = "yolov8n.pt"):
+    watcher = Watcher2D(yolo_version=yolo_version)
+    camera = open_source(clip_path)
+    frames_data = []
+    frame_timestamps = []
+    inference_time = 0.0
+
+    for frame in camera:
+        start_time = perf_counter()
+        output = watcher._predict(frame.image, show=False, classes=watcher.model_classes, verbose=False)
+        frames_data.append(watcher._data_perf(output))
+        frame_timestamps.append(frame.timestamp)
+        inference_time += perf_counter() - start_time
+    camera.release()
+    num_frames = len(frames_data)
+    assert num_frames, f"Failed to read frames from {clip_path}"
+
+    modes = {'per-frame': (None, 0),
+             'tracking': (ObjectTracker(), 0),
+             'tracking + boxes every 30 frames': (ObjectTracker(), 30)}
+    print(f"Frames: {num_frames}, inference: {1000 * inference_time / num_frames:.2f} ms/frame")
+    for mode_name, (tracker, write_boxes_every) in modes.items():
+        log = {}
+        start_time = perf_counter()
+        for frame_index, data in enumerate(frames_data):
+            events = None if tracker is None else tracker.update(data, timestamp=frame_timestamps[frame_index])
+            entry = watcher._log_entry(data, events=events, frame_index=frame_index,
+                                       write_boxes_every=write_boxes_every)
+            if entry is not None:
+                log[str(frame_index)] = entry
+        volume = len(json.dumps(log))
+        logging_time = perf_counter() - start_time
+        print(f"{mode_name}: {len(log)} entries, {volume / 1024:.1f} KiB, "
+              f"logging {1000 * logging_time / num_frames:.3f} ms/frame, "
+              f"loop {1000 * (inference_time + logging_time) / num_frames:.2f} ms/frame")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])